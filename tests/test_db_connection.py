@@ -0,0 +1,104 @@
+import sqlite3
+import threading
+
+import pytest
+
+from db_connection import (
+    BUSY_TIMEOUT_MS,
+    CACHE_SIZE_KIB,
+    ThreadLocalConnections,
+    configure_connection,
+    connect,
+    rebuild_legacy_now_defaults,
+)
+
+
+def test_configure_connection_enables_wal_and_relaxed_sync_on_file_databases(tmp_path):
+    conn = configure_connection(sqlite3.connect(tmp_path / "tuned.db"))
+
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+    assert conn.execute("PRAGMA cache_size").fetchone()[0] == -CACHE_SIZE_KIB
+
+
+def test_configure_connection_raises_but_never_lowers_busy_timeout(tmp_path):
+    short = configure_connection(sqlite3.connect(tmp_path / "short.db", timeout=0))
+    assert short.execute("PRAGMA busy_timeout").fetchone()[0] == BUSY_TIMEOUT_MS
+
+    patient = configure_connection(sqlite3.connect(tmp_path / "patient.db", timeout=30))
+    assert patient.execute("PRAGMA busy_timeout").fetchone()[0] == 30000
+
+
+def test_configure_connection_is_safe_inside_open_transaction():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.execute("INSERT INTO t VALUES (1)")
+    assert conn.in_transaction
+
+    configure_connection(conn)
+
+    assert conn.in_transaction
+    conn.commit()
+
+
+def test_connect_returns_tuned_connection(tmp_path):
+    conn = connect(str(tmp_path / "opened.db"))
+
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == BUSY_TIMEOUT_MS
+
+
+def test_thread_local_connections_reuse_one_connection_per_thread(tmp_path):
+    connections = ThreadLocalConnections(str(tmp_path / "pool.db"))
+    main_conn = connections.get()
+    seen: list[sqlite3.Connection] = []
+
+    worker = threading.Thread(target=lambda: seen.extend([connections.get(), connections.get()]))
+    worker.start()
+    worker.join()
+
+    assert connections.get() is main_conn
+    assert seen[0] is seen[1]
+    assert seen[0] is not main_conn
+    assert main_conn.row_factory is sqlite3.Row
+    assert main_conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    connections.close_all()
+    assert connections.get() is not main_conn
+    connections.close_all()
+
+
+def test_thread_local_connections_reject_in_memory_databases():
+    with pytest.raises(ValueError):
+        ThreadLocalConnections(":memory:")
+
+
+def test_rebuild_legacy_now_defaults_keeps_rows_and_references_to_the_table(tmp_path):
+    conn = sqlite3.connect(tmp_path / "legacy.db")
+    conn.create_function("now", 0, lambda: "2024-01-01 00:00:00")
+    conn.executescript(
+        """
+        CREATE TABLE parent (id INTEGER PRIMARY KEY AUTOINCREMENT, created_at TEXT NOT NULL DEFAULT (now()));
+        CREATE TABLE child (id INTEGER PRIMARY KEY, parent_id INTEGER REFERENCES parent(id));
+        CREATE VIEW parent_view AS SELECT * FROM parent;
+        INSERT INTO parent DEFAULT VALUES;
+        INSERT INTO child (parent_id) VALUES (1);
+        """
+    )
+    create_sql = """
+        CREATE TABLE IF NOT EXISTS parent (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """
+
+    assert rebuild_legacy_now_defaults(conn, "parent", create_sql) is True
+    assert rebuild_legacy_now_defaults(conn, "parent", create_sql) is False
+
+    fresh = sqlite3.connect(tmp_path / "legacy.db")  # no now() registered
+    fresh.execute("INSERT INTO parent DEFAULT VALUES")
+    assert fresh.execute("SELECT id, created_at FROM parent_view ORDER BY id").fetchall()[0] == (1, "2024-01-01 00:00:00")
+    child_sql = fresh.execute("SELECT sql FROM sqlite_master WHERE name = 'child'").fetchone()[0]
+    assert "REFERENCES parent(id)" in child_sql
+    assert fresh.execute("PRAGMA foreign_key_check").fetchall() == []
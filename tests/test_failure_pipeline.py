@@ -122,3 +122,161 @@ def test_same_non_retryable_error_class_after_replay_escalates_automatically():
     assert row["status"] == "escalated"
     assert row["escalated_at"] is not None
     assert row["error_class"] == "TerminalProviderError"
+
+
+def test_start_replay_rolls_back_dead_letter_update_when_run_update_fails():
+    pipeline = make_pipeline()
+    run_id = pipeline.create_run("payload://atomic")
+    dead_letter = pipeline.record_failure(
+        run_id=run_id,
+        failed_stage="enrich",
+        error_class="PolicyError",
+        error_message="blocked",
+        error_metadata={"code": "blocked"},
+        retryable=False,
+    )
+    assert dead_letter is not None
+    pipeline.record_remediation_evidence(dead_letter.id, operator_id="oncall-4", evidence="ticket INC-9")
+    pipeline.conn.execute(
+        """
+        CREATE TRIGGER reject_run_update BEFORE UPDATE ON pipeline_runs
+        BEGIN SELECT RAISE(ABORT, 'run update rejected'); END
+        """
+    )
+
+    with pytest.raises(sqlite3.IntegrityError, match="run update rejected"):
+        pipeline.start_replay(dead_letter.id)
+
+    row = pipeline.get_dead_letter(dead_letter.id)
+    assert row["status"] == "open"
+    assert row["replay_count"] == 0
+
+
+def test_error_details_live_in_side_table_and_follow_replay_failures():
+    pipeline = make_pipeline()
+    run_id = pipeline.create_run("payload://details")
+    dead_letter = pipeline.record_failure(
+        run_id=run_id,
+        failed_stage="publish",
+        error_class="TerminalProviderError",
+        error_message="first failure",
+        error_metadata={"attempt": 1},
+        retryable=False,
+    )
+    assert dead_letter is not None
+
+    columns = {row["name"] for row in pipeline.conn.execute("PRAGMA table_info(dead_letter_entries)")}
+    assert {"error_message", "error_metadata"}.isdisjoint(columns)
+
+    pipeline.record_remediation_evidence(dead_letter.id, operator_id="oncall-5", evidence="retried")
+    pipeline.start_replay(dead_letter.id)
+    pipeline.fail_replay(
+        dead_letter.id,
+        error_class="TransientError",
+        error_message="second failure",
+        error_metadata={"attempt": 2},
+        retryable=True,
+    )
+
+    row = pipeline.get_dead_letter(dead_letter.id)
+    assert row["error_message"] == "second failure"
+    assert row["error_metadata"] == '{"attempt": 2}'
+    assert pipeline.conn.execute("SELECT COUNT(*) FROM dead_letter_details").fetchone()[0] == 1
+
+
+def test_fail_replay_with_new_error_class_reopens_and_records_the_new_class():
+    pipeline = make_pipeline()
+    run_id = pipeline.create_run("payload://reopen")
+    dead_letter = pipeline.record_failure(
+        run_id=run_id,
+        failed_stage="publish",
+        error_class="TerminalProviderError",
+        error_message="provider rejected payload",
+        error_metadata={},
+        retryable=False,
+    )
+    assert dead_letter is not None
+    pipeline.record_remediation_evidence(dead_letter.id, operator_id="oncall-3", evidence="fixed")
+    pipeline.start_replay(dead_letter.id)
+
+    pipeline.fail_replay(
+        dead_letter.id,
+        error_class="SchemaError",
+        error_message="schema drift",
+        error_metadata={},
+        retryable=False,
+    )
+
+    row = pipeline.get_dead_letter(dead_letter.id)
+    assert row["status"] == "open"
+    assert row["escalated_at"] is None
+    assert row["error_class"] == "SchemaError"
+    assert pipeline._get_run(run_id)["status"] == "failed"
+
+
+def test_opening_baseline_database_migrates_inline_error_columns(tmp_path):
+    db_path = tmp_path / "baseline.db"
+    conn = sqlite3.connect(db_path)
+    # The original stores registered now() on their connection and defaulted timestamps to it.
+    conn.create_function("now", 0, lambda: "2024-01-01 00:00:00")
+    conn.executescript(
+        """
+        CREATE TABLE pipeline_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            payload_ref TEXT NOT NULL,
+            current_stage TEXT NOT NULL,
+            status TEXT NOT NULL CHECK (status IN ('running', 'failed', 'completed')),
+            created_at TEXT NOT NULL DEFAULT (now()),
+            updated_at TEXT NOT NULL DEFAULT (now())
+        );
+        CREATE TABLE dead_letter_entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER NOT NULL,
+            failed_stage TEXT NOT NULL,
+            error_class TEXT NOT NULL,
+            error_message TEXT,
+            error_metadata TEXT NOT NULL,
+            original_payload_ref TEXT NOT NULL,
+            remediation_evidence TEXT,
+            replay_start_stage TEXT,
+            replay_count INTEGER NOT NULL DEFAULT 0,
+            resolution_notes TEXT,
+            status TEXT NOT NULL CHECK (status IN ('open', 'replaying', 'resolved', 'escalated')),
+            escalated_at TEXT,
+            resolved_at TEXT,
+            created_at TEXT NOT NULL DEFAULT (now()),
+            updated_at TEXT NOT NULL DEFAULT (now()),
+            FOREIGN KEY(run_id) REFERENCES pipeline_runs(id)
+        );
+        INSERT INTO pipeline_runs (payload_ref, current_stage, status) VALUES ('payload://old', 'enrich', 'failed');
+        INSERT INTO dead_letter_entries
+            (run_id, failed_stage, error_class, error_message, error_metadata, original_payload_ref, status)
+        VALUES (1, 'enrich', 'ValidationError', 'old message', '{"field": "severity"}', 'payload://old', 'open');
+        """
+    )
+    conn.close()
+
+    pipeline = FailureHandlingPipeline(sqlite3.connect(db_path), stages=STAGES)
+
+    old = pipeline.get_dead_letter(1)
+    assert old["error_message"] == "old message"
+    assert old["error_metadata"] == '{"field": "severity"}'
+    columns = [row[1] for row in pipeline.conn.execute("PRAGMA table_info(dead_letter_entries)")]
+    assert "error_metadata" not in columns
+    assert old["created_at"] == "2024-01-01 00:00:00"
+    legacy_defaults = pipeline.conn.execute("SELECT name FROM sqlite_master WHERE sql LIKE '%now()%'").fetchall()
+    assert legacy_defaults == []
+
+    new = pipeline.record_failure(
+        run_id=pipeline.create_run("payload://new"),
+        failed_stage="publish",
+        error_class="ProviderError",
+        error_message="new message",
+        error_metadata={"attempt": 1},
+        retryable=False,
+    )
+    assert new is not None
+    assert pipeline.get_dead_letter(new.id)["error_message"] == "new message"
+
+    # Reopening an already-migrated database is a no-op.
+    assert FailureHandlingPipeline(sqlite3.connect(db_path), stages=STAGES).get_dead_letter(1)["error_message"] == "old message"
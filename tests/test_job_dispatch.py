@@ -1,6 +1,9 @@
 import sqlite3
 
+import pytest
+
 from job_dispatch import JobDispatchStore
+from notification_outbox import NotificationOutboxStore
 
 
 def make_store() -> JobDispatchStore:
@@ -70,3 +73,107 @@ def test_higher_version_rerun_creates_new_attempt_and_uses_new_outbox_keys():
     assert len(v1_rows) == 1
     assert len(v2_rows) == 1
     assert v1_rows[0]["idempotency_key"] != v2_rows[0]["idempotency_key"]
+
+
+def test_insert_conflict_from_concurrent_submit_returns_existing_job():
+    store = make_store()
+    winner = store.submit_job(changelist_id=90, review_version=1, idempotency_key="race-key")
+
+    # Simulate the pre-insert lookup running before the concurrent winner committed.
+    lookups = iter([None])
+    original_lookup = store._get_by_idempotency_key
+    store._get_by_idempotency_key = lambda key: next(lookups, None) or original_lookup(key)
+
+    loser = store.submit_job(changelist_id=90, review_version=1, idempotency_key="race-key")
+
+    assert loser.created is False
+    assert loser.status == "duplicate_idempotency"
+    assert loser.job["id"] == winner.job["id"]
+    assert store.conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 1
+
+
+def test_prior_success_lookup_uses_changelist_status_version_index():
+    store = make_store()
+
+    plan = store.conn.execute(
+        """
+        EXPLAIN QUERY PLAN
+        SELECT *
+        FROM jobs
+        WHERE changelist_id = ?
+          AND status = 'succeeded'
+        ORDER BY review_version DESC, id DESC
+        LIMIT 1
+        """,
+        (1,),
+    ).fetchall()
+    details = " ".join(row[3] for row in plan)
+
+    assert "USING INDEX idx_jobs_cl_status_rv" in details
+    assert "TEMP B-TREE" not in details
+
+
+def test_outbox_store_can_be_injected_but_must_share_the_connection():
+    conn = sqlite3.connect(":memory:")
+    outbox = NotificationOutboxStore(conn)
+
+    assert JobDispatchStore(conn, outbox=outbox).outbox is outbox
+    with pytest.raises(ValueError, match="share"):
+        JobDispatchStore(sqlite3.connect(":memory:"), outbox=outbox)
+
+
+def test_opening_baseline_database_replaces_python_now_defaults(tmp_path):
+    db_path = tmp_path / "baseline.db"
+    conn = sqlite3.connect(db_path)
+    # The original stores registered now() on their connection and defaulted timestamps to it.
+    conn.create_function("now", 0, lambda: "2024-01-01 00:00:00")
+    conn.executescript(
+        """
+        CREATE TABLE jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            changelist_id INTEGER NOT NULL,
+            review_version INTEGER NOT NULL,
+            idempotency_key TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+            created_at TEXT NOT NULL DEFAULT (now()),
+            updated_at TEXT NOT NULL DEFAULT (now()),
+            UNIQUE(idempotency_key)
+        );
+        CREATE TABLE notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            changelist_id INTEGER NOT NULL,
+            recipient TEXT NOT NULL,
+            review_version INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            idempotency_key TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'sent')),
+            notification_id TEXT,
+            notified_at TEXT,
+            created_at TEXT NOT NULL DEFAULT (now()),
+            updated_at TEXT NOT NULL DEFAULT (now()),
+            UNIQUE(changelist_id, recipient, review_version)
+        );
+        INSERT INTO jobs (changelist_id, review_version, idempotency_key) VALUES (7, 1, 'old-key');
+        INSERT INTO jobs (changelist_id, review_version, idempotency_key) VALUES (7, 2, 'deleted-key');
+        DELETE FROM jobs WHERE idempotency_key = 'deleted-key';
+        INSERT INTO notification_outbox (changelist_id, recipient, review_version, payload, idempotency_key)
+        VALUES (7, 'old@example.com', 1, '{}', 'old-outbox-key');
+        """
+    )
+    conn.close()
+
+    store = JobDispatchStore(sqlite3.connect(db_path))
+
+    assert store.conn.execute("SELECT name FROM sqlite_master WHERE sql LIKE '%now()%'").fetchall() == []
+    old = store.submit_job(changelist_id=7, review_version=1, idempotency_key="old-key")
+    assert old.created is False
+    assert old.job["created_at"] == "2024-01-01 00:00:00"
+    new = store.submit_job(changelist_id=8, review_version=1, idempotency_key="new-key")
+    # The AUTOINCREMENT counter survives the rebuild, so the deleted row's id is not reused.
+    assert new.job["id"] == 3
+
+    store.outbox.prepare_rows(changelist_id=8, review_version=1, recipients=["new@example.com"], payload={})
+    assert [row["recipient"] for row in store.outbox.unsent_rows(changelist_id=7, review_version=1)] == [
+        "old@example.com"
+    ]
+    assert len(store.outbox.unsent_rows(changelist_id=8, review_version=1)) == 1
@@ -1,4 +1,8 @@
+import hashlib
 import sqlite3
+import threading
+
+import pytest
 
 from notification_outbox import NotificationOutboxStore
 
@@ -24,6 +28,33 @@ class FakeProvider:
         return provider_message_id in self.lookup_existing
 
 
+class FakeBulkProvider(FakeProvider):
+    def __init__(self):
+        super().__init__()
+        self.bulk_calls: list[list[tuple[str, str, str]]] = []
+
+    def send_bulk(self, messages):
+        self.bulk_calls.append(list(messages))
+        return [f"bulk-{idx}" for idx, _ in enumerate(messages, start=1)]
+
+
+class BarrierProvider(FakeProvider):
+    """Blocks each send until ``parties`` sends are in flight at once."""
+
+    def __init__(self, parties: int, *, fail_recipient: str | None = None):
+        super().__init__()
+        self.barrier = threading.Barrier(parties, timeout=5)
+        self.fail_recipient = fail_recipient
+        self.lock = threading.Lock()
+
+    def send(self, recipient: str, payload: str, *, idempotency_key: str) -> str:
+        self.barrier.wait()
+        if recipient == self.fail_recipient:
+            raise ConnectionError("provider unavailable")
+        with self.lock:
+            return super().send(recipient, payload, idempotency_key=idempotency_key)
+
+
 def make_store() -> NotificationOutboxStore:
     return NotificationOutboxStore(sqlite3.connect(":memory:"))
 
@@ -139,6 +170,179 @@ def test_retry_crash_state_lookup_miss_permits_safe_resend():
     assert persisted["notification_id"] == result.provider_message_id
 
 
+def test_batch_defers_delivery_commits_until_exit(tmp_path):
+    db_path = tmp_path / "outbox.db"
+    store = NotificationOutboxStore(sqlite3.connect(db_path))
+    provider = FakeProvider()
+    store.prepare_rows(
+        changelist_id=6,
+        review_version=1,
+        recipients=["a@example.com", "b@example.com"],
+        payload={"body": "batched"},
+    )
+    rows = store.unsent_rows(changelist_id=6, review_version=1)
+    observer = sqlite3.connect(db_path)
+
+    def committed_sent() -> int:
+        return observer.execute("SELECT COUNT(*) FROM notification_outbox WHERE notified_at IS NOT NULL").fetchone()[0]
+
+    with store.batch():
+        for row in rows:
+            store.deliver_row(row["id"], provider)
+        assert store.conn.in_transaction
+        assert committed_sent() == 0
+
+    assert not store.conn.in_transaction
+    assert committed_sent() == 2
+
+
+def test_deliver_pending_commits_all_marks_once(tmp_path):
+    db_path = tmp_path / "outbox.db"
+    store = NotificationOutboxStore(sqlite3.connect(db_path))
+    store.prepare_rows(
+        changelist_id=7,
+        review_version=1,
+        recipients=["a@example.com", "b@example.com", "c@example.com"],
+        payload={"body": "one commit"},
+    )
+    observer = sqlite3.connect(db_path)
+    committed_during_sends: list[int] = []
+
+    class ObservingProvider(FakeProvider):
+        def send(self, recipient: str, payload: str, *, idempotency_key: str) -> str:
+            committed_during_sends.append(
+                observer.execute("SELECT COUNT(*) FROM notification_outbox WHERE notified_at IS NOT NULL").fetchone()[0]
+            )
+            return super().send(recipient, payload, idempotency_key=idempotency_key)
+
+    results = store.deliver_pending(changelist_id=7, review_version=1, provider=ObservingProvider(), max_workers=1)
+
+    assert [r.status for r in results] == ["sent", "sent", "sent"]
+    assert committed_during_sends == [0, 0, 0]
+    assert observer.execute("SELECT COUNT(*) FROM notification_outbox WHERE notified_at IS NOT NULL").fetchone()[0] == 3
+
+
+def test_deliver_pending_calls_send_on_the_calling_thread_by_default():
+    store = make_store()
+    store.prepare_rows(
+        changelist_id=13,
+        review_version=1,
+        recipients=["a@example.com", "b@example.com", "c@example.com"],
+        payload={"body": "serial"},
+    )
+    send_threads: list[int] = []
+
+    class ThreadRecordingProvider(FakeProvider):
+        def send(self, recipient: str, payload: str, *, idempotency_key: str) -> str:
+            send_threads.append(threading.get_ident())
+            return super().send(recipient, payload, idempotency_key=idempotency_key)
+
+    results = store.deliver_pending(changelist_id=13, review_version=1, provider=ThreadRecordingProvider())
+
+    assert [r.status for r in results] == ["sent", "sent", "sent"]
+    assert send_threads == [threading.get_ident()] * 3
+
+
+@pytest.mark.parametrize("path", ["serial", "fan_out", "bulk"])
+def test_provider_is_never_called_inside_an_open_write_transaction(tmp_path, path):
+    db_path = tmp_path / "outbox.db"
+    store = NotificationOutboxStore(sqlite3.connect(db_path))
+    store.prepare_rows(
+        changelist_id=12,
+        review_version=1,
+        recipients=["a@example.com", "b@example.com", "c@example.com", "d@example.com"],
+        payload={"body": "no open transaction"},
+    )
+    rows = store.unsent_rows(changelist_id=12, review_version=1)
+    # a@ was accepted before a crash; reconciling it must not leave a transaction open for the sends.
+    store.conn.execute("UPDATE notification_outbox SET notification_id = 'msg-crashed' WHERE id = ?", (rows[0]["id"],))
+    store.conn.commit()
+    in_transaction_during_calls: list[bool] = []
+
+    class ObservingProvider(FakeBulkProvider):
+        def send(self, recipient: str, payload: str, *, idempotency_key: str) -> str:
+            in_transaction_during_calls.append(store.conn.in_transaction)
+            return super().send(recipient, payload, idempotency_key=idempotency_key)
+
+        def lookup(self, provider_message_id: str) -> bool:
+            in_transaction_during_calls.append(store.conn.in_transaction)
+            return super().lookup(provider_message_id)
+
+        def send_bulk(self, messages):
+            in_transaction_during_calls.append(store.conn.in_transaction)
+            return super().send_bulk(messages)
+
+    provider = ObservingProvider()
+    provider.lookup_existing.add("msg-crashed")
+    if path == "bulk":
+        results = store.deliver_pending_bulk(changelist_id=12, review_version=1, provider=provider)
+    else:
+        provider.send_bulk = None
+        results = store.deliver_pending(
+            changelist_id=12, review_version=1, provider=provider, max_workers=1 if path == "serial" else 4
+        )
+
+    assert [r.status for r in results] == ["reconciled", "sent", "sent", "sent"]
+    assert len(in_transaction_during_calls) == (2 if path == "bulk" else 4)
+    assert not any(in_transaction_during_calls)
+    assert not store.conn.in_transaction
+    assert sqlite3.connect(db_path).execute(
+        "SELECT COUNT(*) FROM notification_outbox WHERE notified_at IS NOT NULL"
+    ).fetchone()[0] == 4
+
+
+def test_deliver_pending_overlaps_provider_sends_and_marks_successes_before_raising():
+    store = make_store()
+    store.prepare_rows(
+        changelist_id=9,
+        review_version=1,
+        recipients=["a@example.com", "b@example.com", "c@example.com"],
+        payload={"body": "fan-out"},
+    )
+
+    # A serial loop would time out on the barrier; all three sends must be in flight together.
+    provider = BarrierProvider(3, fail_recipient="b@example.com")
+    with pytest.raises(ConnectionError):
+        store.deliver_pending(changelist_id=9, review_version=1, provider=provider, max_workers=3)
+
+    assert [row["recipient"] for row in store.unsent_rows(changelist_id=9, review_version=1)] == ["b@example.com"]
+
+    retry = store.deliver_pending(changelist_id=9, review_version=1, provider=FakeProvider())
+    assert [r.status for r in retry] == ["sent"]
+
+
+def test_deliver_pending_bulk_sends_fresh_rows_in_one_call_and_reconciles_ambiguous_rows():
+    store = make_store()
+    provider = FakeBulkProvider()
+    store.prepare_rows(
+        changelist_id=8,
+        review_version=2,
+        recipients=["a@example.com", "b@example.com", "c@example.com"],
+        payload={"body": "bulk"},
+    )
+    rows = store.unsent_rows(changelist_id=8, review_version=2)
+    # c@ crashed after the provider accepted it but before notified_at was persisted.
+    provider.lookup_existing.add("msg-crashed")
+    store.conn.execute("UPDATE notification_outbox SET notification_id = 'msg-crashed' WHERE id = ?", (rows[2]["id"],))
+    store.conn.commit()
+
+    results = store.deliver_pending_bulk(changelist_id=8, review_version=2, provider=provider)
+
+    assert [(r.status, r.provider_message_id) for r in results] == [
+        ("sent", "bulk-1"),
+        ("sent", "bulk-2"),
+        ("reconciled", "msg-crashed"),
+    ]
+    assert len(provider.bulk_calls) == 1
+    assert [message[0] for message in provider.bulk_calls[0]] == ["a@example.com", "b@example.com"]
+    assert provider.send_calls == []
+    assert store.unsent_rows(changelist_id=8, review_version=2) == []
+    assert store.get_row(rows[0]["id"])["notification_id"] == "bulk-1"
+
+    assert store.deliver_pending_bulk(changelist_id=8, review_version=2, provider=provider) == []
+    assert len(provider.bulk_calls) == 1
+
+
 def test_idempotency_key_is_deterministic_from_tuple():
     key1 = NotificationOutboxStore.idempotency_key(123, "r@example.com", 4)
     key2 = NotificationOutboxStore.idempotency_key(123, "r@example.com", 4)
@@ -146,3 +350,41 @@ def test_idempotency_key_is_deterministic_from_tuple():
 
     assert key1 == key2
     assert key1 != key3
+
+
+def test_prepare_rows_keys_match_the_single_call_key():
+    store = NotificationOutboxStore(sqlite3.connect(":memory:"))
+    store.prepare_rows(changelist_id=9, review_version=3, recipients=["a@example.com", "b@example.com"], payload={})
+
+    rows = store.unsent_rows(changelist_id=9, review_version=3)
+
+    assert [row["idempotency_key"] for row in rows] == [
+        NotificationOutboxStore.idempotency_key(9, "a@example.com", 3),
+        NotificationOutboxStore.idempotency_key(9, "b@example.com", 3),
+    ]
+    assert rows[0]["idempotency_key"] == hashlib.blake2b(b"9:a@example.com:3", digest_size=16).hexdigest()
+
+
+def test_unsent_rows_uses_partial_pending_index():
+    store = NotificationOutboxStore(sqlite3.connect(":memory:"))
+
+    plan = store.conn.execute(
+        """
+        EXPLAIN QUERY PLAN
+        SELECT * FROM notification_outbox
+        WHERE changelist_id = ? AND review_version = ? AND notified_at IS NULL
+        ORDER BY recipient ASC, id ASC
+        """,
+        (1, 1),
+    ).fetchall()
+
+    assert any("ix_outbox_pending" in row["detail"] for row in plan)
+
+
+def test_prepare_rows_stores_one_compact_payload_for_every_recipient():
+    store = NotificationOutboxStore(sqlite3.connect(":memory:"))
+    store.prepare_rows(changelist_id=4, review_version=1, recipients=["a", "b"], payload={"z": 1, "a": [1, 2]})
+
+    payloads = {row["payload"] for row in store.unsent_rows(changelist_id=4, review_version=1)}
+
+    assert payloads == {'{"a":[1,2],"z":1}'}
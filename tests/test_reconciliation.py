@@ -0,0 +1,39 @@
+from reconciliation import normalize_repo_path, normalized_changed_files, reconcile_changed_file, reconcile_many
+
+
+def test_normalize_repo_path_trims_converts_separators_and_drops_leading_dot_slash():
+    assert normalize_repo_path("  ./src\\pkg\\main.py ") == "src/pkg/main.py"
+    assert normalize_repo_path("src/main.py") == "src/main.py"
+
+
+def test_normalize_repo_path_caches_repeated_raw_paths():
+    normalize_repo_path.cache_clear()
+
+    assert normalize_repo_path(" src\\a.py") == "src/a.py"
+    assert normalize_repo_path(" src\\a.py") == "src/a.py"
+
+    assert normalize_repo_path.cache_info().hits == 1
+
+
+def test_reconcile_changed_file_normalizes_both_sides():
+    changed = {".\\src\\main.py", "docs/readme.md"}
+
+    assert reconcile_changed_file("src/main.py", changed) is True
+    assert reconcile_changed_file(" ./docs/readme.md", changed) is True
+    assert reconcile_changed_file("src/other.py", changed) is False
+
+
+def test_normalized_changed_files_is_computed_once_per_set():
+    changed = frozenset({"./a.py", "b\\c.py"})
+
+    first = normalized_changed_files(changed)
+    second = normalized_changed_files(frozenset(changed))
+
+    assert first == frozenset({"a.py", "b/c.py"})
+    assert second is first
+
+
+def test_reconcile_many_returns_matching_normalized_paths():
+    matched = reconcile_many(["./a.py", "b/c.py", "missing.py"], {"a.py", "b\\c.py"})
+
+    assert matched == {"a.py", "b/c.py"}
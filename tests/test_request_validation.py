@@ -1,6 +1,8 @@
 import json
 
-from request_validation import DiagnosticRecorder, validate_and_reconcile_review_result
+import pytest
+
+from request_validation import DiagnosticRecorder, validate_and_reconcile_many, validate_and_reconcile_review_result
 
 
 def _base_finding(**overrides):
@@ -85,6 +87,9 @@ def test_rejects_invalid_json_and_findings_non_array_with_standard_diagnostic_sc
     assert bad_json.diagnostics[0]["code"] == "invalid_json"
     assert {"code", "field", "reason", "action"}.issubset(bad_json.diagnostics[0])
 
+    bad_bytes = validate_and_reconcile_review_result(b'{"s\xff": 1}', changed_files=[], correlation_id="corr-3b")
+    assert bad_bytes.diagnostics[0]["code"] == "invalid_json"
+
     bad_findings = validate_and_reconcile_review_result(
         json.dumps({"schema_version": "1.0", "prompt_version": "1.0.0", "findings": {}}),
         changed_files=["src/main.py"],
@@ -153,6 +158,24 @@ def test_rejects_incompatible_or_malformed_contract_versions():
     assert incompatible_prompt.diagnostics[0]["field"] == "prompt_version"
 
 
+def test_version_parsing_rejects_malformed_shapes():
+    for schema_version in ("1", "1.0.0", "1.", ".0", "1.0\n", " 1.0", "\u00b9.0"):
+        outcome = validate_and_reconcile_review_result(
+            json.dumps({"schema_version": schema_version, "prompt_version": "1.0.0", "findings": []}),
+            changed_files=["src/main.py"],
+            correlation_id="corr-11",
+        )
+        assert outcome.diagnostics[0]["reason"] == "invalid_schema_version_format", schema_version
+
+    for prompt_version in ("1", "1.0.0.0", "1.0.", "1.0.x"):
+        outcome = validate_and_reconcile_review_result(
+            json.dumps({"schema_version": "1.0", "prompt_version": prompt_version, "findings": []}),
+            changed_files=["src/main.py"],
+            correlation_id="corr-12",
+        )
+        assert outcome.diagnostics[0]["reason"] == "invalid_prompt_version_format", prompt_version
+
+
 def test_accepts_backward_compatible_contract_versions():
     outcome = validate_and_reconcile_review_result(
         json.dumps({
@@ -183,3 +206,137 @@ def test_recorder_can_be_supplied_for_audit_replay_capture():
 
     assert recorder.entries
     assert recorder.entries[0]["correlation_id"] == "corr-5"
+
+
+def test_diagnostics_can_stay_columnar_when_not_materialized():
+    recorder = DiagnosticRecorder()
+    payload = {
+        "schema_version": "1.0",
+        "prompt_version": "1.0.0",
+        "findings": [_base_finding(file="src/unmatched.py")],
+    }
+    outcome = validate_and_reconcile_review_result(
+        json.dumps(payload),
+        changed_files=["src/main.py"],
+        correlation_id="corr-6",
+        recorder=recorder,
+        materialize_diagnostics=False,
+    )
+
+    assert outcome.diagnostics == []
+    assert [code for _, code, *_ in recorder.iter_entries()] == ["file_not_in_changed_files", "all_findings_dropped"]
+    assert recorder.entries[0]["details"] == {"finding_index": 0, "file": "src/unmatched.py"}
+    assert "details" not in recorder.entries[1]
+
+
+def test_reconciliation_matches_normalized_paths_and_drops_non_string_files():
+    payload = {
+        "schema_version": "1.0",
+        "prompt_version": "1.0.0",
+        "findings": [
+            _base_finding(id="f1", file=" .\\src\\main.py"),
+            _base_finding(id="f2", file=42),
+        ],
+    }
+    outcome = validate_and_reconcile_review_result(
+        json.dumps(payload),
+        changed_files=["./src/main.py"],
+        correlation_id="corr-7",
+    )
+
+    assert [finding["id"] for finding in outcome.review_result["findings"]] == ["f1"]
+    dropped = [d for d in outcome.diagnostics if d["code"] == "file_not_in_changed_files"]
+    assert dropped == [
+        {
+            "correlation_id": "corr-7",
+            "code": "file_not_in_changed_files",
+            "field": "file",
+            "reason": "unmatched_changed_file",
+            "action": "drop",
+            "details": {"finding_index": 1, "file": 42},
+        }
+    ]
+
+
+def test_kept_findings_share_canonical_enum_strings():
+    payload = {
+        "schema_version": "1.0",
+        "prompt_version": "1.0.0",
+        "findings": [_base_finding(id="f1", confidence="low"), _base_finding(id="f2", severity=" high ")],
+    }
+    outcome = validate_and_reconcile_review_result(
+        json.dumps(payload),
+        changed_files=["src/main.py"],
+        correlation_id="corr-13",
+    )
+
+    first, second = outcome.review_result["findings"]
+    assert first["severity"] is second["severity"]
+    assert first["category"] is second["category"]
+    assert first["confidence"] == "low"
+
+
+def test_validate_many_shares_changed_files_and_can_share_one_recorder():
+    good = json.dumps({"schema_version": "1.0", "prompt_version": "1.0.0", "findings": [_base_finding()]})
+    shared = DiagnosticRecorder()
+
+    outcomes = validate_and_reconcile_many(
+        [good, b"{not json"],
+        changed_files=["./src/main.py"],
+        correlation_ids=["corr-a", "corr-b"],
+        recorder_factory=lambda: shared,
+        materialize_diagnostics=False,
+    )
+
+    assert [outcome.rejected for outcome in outcomes] == [False, True]
+    assert len(outcomes[0].review_result["findings"]) == 1
+    assert [(cid, code) for cid, code, *_ in shared.iter_entries()] == [("corr-b", "invalid_json")]
+
+    with pytest.raises(ValueError):
+        validate_and_reconcile_many([good], changed_files=[], correlation_ids=[])
+
+
+def test_oversized_and_non_object_payloads_are_rejected_before_parsing(monkeypatch):
+    monkeypatch.setattr("request_validation.MAX_PAYLOAD_BYTES", 16)
+    too_large = validate_and_reconcile_review_result(
+        json.dumps({"schema_version": "1.0", "prompt_version": "1.0.0", "findings": []}),
+        changed_files=["src/main.py"],
+        correlation_id="corr-14",
+    )
+    assert too_large.rejected is True
+    assert too_large.diagnostics[0]["code"] == "payload_too_large"
+    assert too_large.diagnostics[0]["details"]["max"] == 16
+
+    monkeypatch.setattr("request_validation._loads", lambda raw: pytest.fail("parser must not run"))
+    for raw in ("  [1, 2", "0", "-1", b"\n\"string\"", "true", b" null", "false"):
+        not_object = validate_and_reconcile_review_result(raw, changed_files=[], correlation_id="corr-15")
+        assert not_object.diagnostics[0]["reason"] == "top_level_not_object"
+
+
+def test_malformed_payload_heads_still_reach_the_parser_as_invalid_json():
+    for raw in ("oops", "nope", '\ufeff{"findings": []}', "\x0b{}", b"\xff\xfe", "<html>"):
+        outcome = validate_and_reconcile_review_result(raw, changed_files=[], correlation_id="corr-15b")
+        assert outcome.rejected is True
+        assert outcome.diagnostics[0]["code"] == "invalid_json", raw
+
+
+def test_only_plain_digit_line_strings_coerce():
+    lines = ["-1", "1_0", " 12", "12\n", "+3", "²", "7"]
+    payload = {
+        "schema_version": "1.0",
+        "prompt_version": "1.0.0",
+        "findings": [_base_finding(id=f"f{idx}", line=line) for idx, line in enumerate(lines)],
+    }
+    outcome = validate_and_reconcile_review_result(
+        json.dumps(payload),
+        changed_files=["src/main.py"],
+        correlation_id="corr-16",
+    )
+
+    coerced = [(d["details"]["finding_index"], d["details"]["new"]) for d in outcome.diagnostics if d["reason"] == "numeric_string_to_int"]
+    assert coerced == [(6, 7)]
+    range_drops = [
+        d["details"]["finding_index"] for d in outcome.diagnostics if d.get("reason") == "line_must_be_positive_int"
+    ]
+    assert range_drops == [0, 1, 2, 3, 4, 5]
+    assert [finding["line"] for finding in outcome.review_result["findings"]] == [7]
@@ -1,11 +1,17 @@
-import pytest
+import json
 import sqlite3
 import threading
 import time
+from dataclasses import asdict
+
+import pytest
 
+from db_connection import ThreadLocalConnections
 from work_queue import (
     IdleBackoffPolicy,
     WorkQueueStore,
+    WorkerEvent,
+    WorkerRunResult,
     WorkerRuntime,
     compute_idle_backoff_delay_seconds,
 )
@@ -148,7 +154,7 @@ def test_requeue_expired_running_is_idempotent():
     store.conn.execute(
         """
         UPDATE work_queue
-        SET lease_expires_at = datetime(now(), '-10 seconds')
+        SET lease_expires_at = unixepoch() - 10
         WHERE id = ?
         """,
         (expired,),
@@ -184,7 +190,7 @@ def test_requeue_and_claim_next_are_concurrency_safe(tmp_path):
     store1.conn.execute(
         """
         UPDATE work_queue
-        SET lease_expires_at = datetime(now(), '-30 seconds')
+        SET lease_expires_at = unixepoch() - 30
         WHERE id = ?
         """,
         (job_id,),
@@ -244,6 +250,42 @@ def test_runtime_periodically_renews_lease_while_processing():
     heartbeat_events = [event for event in result.events if event.type == "heartbeat_renewed"]
     assert len(heartbeat_events) >= 2
     assert all(event.payload["status"] == "running" for event in heartbeat_events)
+    assert heartbeat_events[0].payload == {"status": "running", "lease_duration_seconds": 3}
+    assert json.loads(json.dumps([asdict(event) for event in result.events]))[0]["payload"] == {
+        "status": "running",
+        "lease_duration_seconds": 3,
+    }
+    # Each event owns its payload, so annotating one leaves the others intact.
+    heartbeat_events[0].payload["observed"] = True
+    assert "observed" not in heartbeat_events[1].payload
+
+
+def test_runtime_reads_clock_once_per_step():
+    store = make_store()
+    job_id = store.enqueue("clock-job")
+    store.claim(job_id, "worker-1")
+
+    clock = {"now": 0.0, "reads": 0}
+
+    def now_fn() -> float:
+        clock["reads"] += 1
+        return clock["now"]
+
+    runtime = WorkerRuntime(store, "worker-1", now_fn=now_fn)
+
+    steps = {"count": 0}
+
+    def process_step() -> bool:
+        steps["count"] += 1
+        clock["now"] += 1.0
+        return steps["count"] < 5
+
+    result = runtime.process_running_job(job_id, process_step, lease_duration_seconds=3)
+
+    assert result.status == "processing_complete"
+    assert len([event for event in result.events if event.type == "heartbeat_renewed"]) == 4
+    # One read to seed the first deadline, then one per step.
+    assert clock["reads"] == 1 + steps["count"]
 
 
 def test_runtime_stops_immediately_and_emits_event_when_lease_is_lost():
@@ -288,8 +330,7 @@ def test_claim_next_enforces_global_max_active_running_capacity():
     store = make_store()
     max_running = 2
 
-    for idx in range(4):
-        store.enqueue(f"job-{idx}", run_at="2000-01-01 00:00:00")
+    store.enqueue_many([(f"job-{idx}", 0, "2000-01-01 00:00:00") for idx in range(4)])
 
     first = store.claim_next("worker-1", max_active_running=max_running)
     second = store.claim_next("worker-2", max_active_running=max_running)
@@ -305,12 +346,22 @@ def test_claim_next_enforces_global_max_active_running_capacity():
         FROM work_queue
         WHERE status = 'running'
           AND lease_expires_at IS NOT NULL
-          AND lease_expires_at > now()
+          AND lease_expires_at > unixepoch()
         """
     ).fetchone()[0]
     assert active_non_expired == max_running
 
 
+def test_claim_next_capacity_zero_never_claims_and_one_admits_first_claim():
+    store = make_store()
+    store.enqueue_many([("a", 0, "2000-01-01 00:00:00"), ("b", 0, "2000-01-01 00:00:00")])
+
+    assert store.claim_next("worker-1", max_active_running=0) is None
+    assert store.claim_next("worker-1", max_active_running=1) is not None
+    assert store.claim_next("worker-2", max_active_running=1) is None
+    assert store.claim_next("worker-2", max_active_running=2) is not None
+
+
 def test_claim_next_reclaims_expired_running_before_capacity_check():
     store = make_store()
     max_running = 1
@@ -325,7 +376,7 @@ def test_claim_next_reclaims_expired_running_before_capacity_check():
     store.conn.execute(
         """
         UPDATE work_queue
-        SET lease_expires_at = datetime(now(), '-30 seconds')
+        SET lease_expires_at = unixepoch() - 30
         WHERE id = ?
         """,
         (expired,),
@@ -401,3 +452,353 @@ def test_idle_backoff_validates_inputs():
             1,
             policy=IdleBackoffPolicy(operational_ceiling_seconds=0.0),
         )
+
+
+def test_batch_defers_mutation_commits_until_exit(tmp_path):
+    db_path = tmp_path / "queue.db"
+    store = WorkQueueStore(sqlite3.connect(db_path))
+    observer = sqlite3.connect(db_path)
+
+    with store.batch():
+        first = store.enqueue("a")
+        store.enqueue("b")
+        claimed = store.claim_next("worker-1")
+        assert claimed["id"] == first
+        assert observer.execute("SELECT COUNT(*) FROM work_queue").fetchone()[0] == 0
+
+    assert observer.execute("SELECT COUNT(*) FROM work_queue").fetchone()[0] == 2
+    assert observer.execute("SELECT status FROM work_queue WHERE id = ?", (first,)).fetchone()[0] == "running"
+
+
+def test_batch_rolls_back_every_mutation_when_the_block_raises(tmp_path):
+    db_path = tmp_path / "queue.db"
+    store = WorkQueueStore(sqlite3.connect(db_path))
+    kept = store.enqueue("kept")
+
+    with pytest.raises(RuntimeError):
+        with store.batch():
+            store.enqueue("discarded")
+            store.claim(kept, "worker-1")
+            raise RuntimeError("caller failed mid-batch")
+
+    observer = sqlite3.connect(db_path)
+    assert observer.execute("SELECT id, status FROM work_queue").fetchall() == [(kept, "queued")]
+    assert store._in_batch is False
+    # The store keeps working after a rolled-back batch.
+    assert store.claim(kept, "worker-1").ok is True
+    assert observer.execute("SELECT status FROM work_queue WHERE id = ?", (kept,)).fetchone()[0] == "running"
+
+
+def test_claim_and_requeue_queries_use_partial_status_indexes():
+    store = make_store()
+
+    claim_plan = store.conn.execute(
+        """
+        EXPLAIN QUERY PLAN
+        SELECT id, priority, created_at FROM work_queue
+        WHERE status = 'queued' AND run_at <= unixepoch()
+        ORDER BY priority DESC, created_at ASC, id ASC
+        LIMIT 1
+        """
+    ).fetchall()
+    requeue_plan = store.conn.execute(
+        """
+        EXPLAIN QUERY PLAN
+        UPDATE work_queue SET status = 'queued'
+        WHERE status = 'running' AND lease_expires_at IS NOT NULL AND lease_expires_at <= unixepoch()
+        """
+    ).fetchall()
+
+    assert [row["detail"] for row in claim_plan] == ["SCAN work_queue USING INDEX idx_wq_runnable_at"]
+    assert any("idx_wq_running_lease" in row["detail"] for row in requeue_plan)
+
+
+def test_writers_in_one_process_queue_on_the_write_lock_instead_of_sqlite_busy(tmp_path):
+    db_path = tmp_path / "queue-lock.db"
+    stores = [WorkQueueStore(sqlite3.connect(db_path, check_same_thread=False)) for _ in range(2)]
+    for store in stores:
+        # With no busy wait, any collision inside SQLite would raise "database is locked".
+        store.conn.execute("PRAGMA busy_timeout=0")
+    errors: list[Exception] = []
+
+    def writer(store: WorkQueueStore) -> None:
+        try:
+            for idx in range(50):
+                job_id = store.enqueue(f"job-{idx}")
+                store.claim(job_id, f"worker-{id(store)}")
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=writer, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert stores[0].conn.execute("SELECT COUNT(*) FROM work_queue WHERE status = 'running'").fetchone()[0] == 100
+
+
+def test_success_results_are_independent_serializable_instances():
+    store = make_store()
+    first = store.enqueue("a")
+    second = store.enqueue("b")
+
+    claimed = store.claim(first, "worker-1")
+    assert claimed.diagnostics == {"code": "ok"}
+    assert json.loads(json.dumps(claimed.diagnostics)) == {"code": "ok"}
+    assert asdict(claimed) == {"ok": True, "rows_affected": 1, "diagnostics": {"code": "ok"}}
+    # A caller annotating one result must not leak into later ones.
+    claimed.diagnostics["note"] = "annotated"
+    assert store.claim(second, "worker-1").diagnostics == {"code": "ok"}
+
+    done = store.complete(first, "worker-1")
+    assert json.dumps(asdict(done), sort_keys=True) == (
+        '{"diagnostics": {"code": "ok", "to": "completed"}, "ok": true, "rows_affected": 1}'
+    )
+    done.diagnostics["to"] = "mutated"
+    assert store.complete(second, "worker-1").diagnostics == {"code": "ok", "to": "completed"}
+
+
+def test_mutations_open_immediate_transactions_and_roll_back_on_error():
+    store = make_store()
+    statements: list[str] = []
+    store.conn.set_trace_callback(statements.append)
+
+    job_id = store.enqueue("a")
+    store.claim(job_id, "worker-1")
+    assert statements.count("BEGIN IMMEDIATE") == 2
+    assert not any(stmt.strip() == "BEGIN" for stmt in statements)
+
+    store.conn.set_trace_callback(None)
+    store.conn.execute(
+        "CREATE TEMP TRIGGER reject_insert BEFORE INSERT ON work_queue BEGIN SELECT RAISE(ABORT, 'rejected'); END"
+    )
+    with pytest.raises(sqlite3.IntegrityError, match="rejected"):
+        store.enqueue("b")
+    assert store.conn.in_transaction is False
+
+
+def test_timestamps_are_stored_as_integer_unix_seconds():
+    store = make_store()
+    job_id = store.enqueue("a", run_at="2000-01-01 00:00:00")
+    store.enqueue("b", run_at=946684800)
+    store.claim_next("worker-1", lease_duration_seconds=30)
+
+    job = store.get_job(job_id)
+    assert job["run_at"] == 946684800
+    assert job["lease_expires_at"] - job["started_at"] == 30
+    types = store.conn.execute(
+        "SELECT DISTINCT typeof(run_at), typeof(created_at), typeof(updated_at) FROM work_queue"
+    ).fetchall()
+    assert [tuple(row) for row in types] == [("integer", "integer", "integer")]
+
+
+def test_enqueue_many_inserts_in_order_and_returns_ids():
+    store = make_store()
+    store.enqueue("before")
+
+    ids = store.enqueue_many([("a", 1, None), ("b", 5, 946684800), ("c", 0, "2000-01-01 00:00:00")])
+
+    assert [store.get_job(job_id)["payload"] for job_id in ids] == ["a", "b", "c"]
+    assert store.get_job(ids[1])["priority"] == 5
+    assert store.get_job(ids[2])["run_at"] == 946684800
+    assert store.enqueue_many([]) == []
+
+
+def test_claim_next_writes_only_the_claimed_row_when_other_leases_expired():
+    store = make_store()
+    first, second = store.enqueue_many([("a", 0, "2000-01-01 00:00:00"), ("b", 0, "2000-01-01 00:00:00")])
+    store.claim(first, "stale-1")
+    store.claim(second, "stale-2")
+    store.conn.execute("UPDATE work_queue SET lease_expires_at = unixepoch() - 5")
+    store.conn.commit()
+
+    changes_before = store.conn.total_changes
+    claimed = store.claim_next("worker-1")
+
+    assert claimed["id"] == first
+    assert store.conn.total_changes - changes_before == 1
+    assert store.get_job(second)["claimed_by"] == "stale-2"
+    assert store.requeue_expired_running().rows_affected == 1
+
+
+def test_state_lookup_uses_plain_tuples_without_changing_caller_rows():
+    store = make_store()
+    job_id = store.enqueue("tuple-job")
+    store.claim(job_id, "owner")
+
+    assert store._get_state(job_id) == ("running", "owner")
+    assert store._get_state(job_id + 1) == (None, None)
+    assert isinstance(store.get_job(job_id), sqlite3.Row)
+
+
+def test_result_types_are_slotted():
+    result = make_store().requeue_expired_running()
+    event = WorkerEvent(type="heartbeat_renewed", job_id=1, worker_id="w", payload={})
+    assert not hasattr(result, "__dict__")
+    assert not hasattr(event, "__dict__")
+    assert not hasattr(WorkerRunResult(status="processing_complete", lease_lost=False, events=[event]), "__dict__")
+
+
+def test_store_shared_across_threads_uses_per_thread_connections(tmp_path):
+    connections = ThreadLocalConnections(str(tmp_path / "shared.db"))
+    store = WorkQueueStore(connections)
+    store.enqueue_many([(f"job-{idx}", 0, "2000-01-01 00:00:00") for idx in range(4)])
+    claimed: list[int] = []
+    claimed_lock = threading.Lock()
+
+    def worker(worker_id: str) -> None:
+        with store.batch():
+            row = store.claim_next(worker_id)
+        with claimed_lock:
+            claimed.append(row["id"])
+
+    threads = [threading.Thread(target=worker, args=(f"w{idx}",)) for idx in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == [1, 2, 3, 4]
+    assert store._in_batch is False
+    connections.close_all()
+
+
+def test_claim_next_batch_claims_in_priority_order_and_reclaims_expired_leases():
+    store = make_store()
+    low, high, later = store.enqueue_many(
+        [("low", 0, "2000-01-01 00:00:00"), ("high", 5, "2000-01-01 00:00:00"), ("later", 9, "2999-01-01 00:00:00")]
+    )
+    expired = store.enqueue("expired", priority=1, run_at="2000-01-01 00:00:00")
+    store.claim(expired, "crashed")
+    store.conn.execute("UPDATE work_queue SET lease_expires_at = unixepoch() - 5 WHERE id = ?", (expired,))
+    store.conn.commit()
+
+    claimed = store.claim_next_batch("dispatcher", 5, lease_duration_seconds=60)
+
+    assert [row["id"] for row in claimed] == [high, expired, low]
+    assert all(row["claimed_by"] == "dispatcher" and row["status"] == "running" for row in claimed)
+    assert store.get_job(later)["status"] == "queued"
+    assert store.claim_next_batch("dispatcher", 5) == []
+
+
+def test_claim_next_batch_trims_to_remaining_capacity():
+    store = make_store()
+    store.enqueue_many([(f"job-{idx}", 0, "2000-01-01 00:00:00") for idx in range(5)])
+    assert store.claim_next("worker-1", max_active_running=3) is not None
+
+    claimed = store.claim_next_batch("dispatcher", 5, max_active_running=3)
+
+    assert len(claimed) == 2
+    assert store.claim_next_batch("dispatcher", 5, max_active_running=3) == []
+    assert len(store.claim_next_batch("dispatcher", 1)) == 1
+    with pytest.raises(ValueError):
+        store.claim_next_batch("dispatcher", 0)
+
+
+def test_writer_locks_are_scoped_per_database_file(tmp_path):
+    first = WorkQueueStore(sqlite3.connect(tmp_path / "a.db", check_same_thread=False))
+    same_file = WorkQueueStore(sqlite3.connect(tmp_path / "a.db", check_same_thread=False))
+    other = WorkQueueStore(sqlite3.connect(tmp_path / "b.db", check_same_thread=False))
+    assert first._write_lock is same_file._write_lock
+    assert first._write_lock is not other._write_lock
+    memory_a, memory_b = make_store(), make_store()
+    assert memory_a._write_lock is not memory_b._write_lock
+
+    finished = threading.Event()
+
+    def write_other() -> None:
+        other.enqueue("unblocked")
+        finished.set()
+
+    with first.batch():
+        first.enqueue("held")
+        writer = threading.Thread(target=write_other)
+        writer.start()
+        # A batch on a.db must not hold up writers to b.db.
+        assert finished.wait(timeout=5)
+    writer.join()
+
+
+def test_text_timestamp_table_is_migrated_to_unix_seconds(tmp_path):
+    db_path = tmp_path / "text-timestamps.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript(
+        """
+        CREATE TABLE work_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            payload TEXT,
+            status TEXT NOT NULL CHECK (status IN ('queued', 'running', 'completed', 'failed')),
+            priority INTEGER NOT NULL DEFAULT 0,
+            run_at TEXT NOT NULL DEFAULT (datetime('now')),
+            claimed_by TEXT,
+            lease_expires_at TEXT,
+            started_at TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+        );
+        CREATE INDEX idx_wq_running_lease ON work_queue(lease_expires_at) WHERE status = 'running';
+        INSERT INTO work_queue (payload, status, run_at) VALUES ('due', 'queued', '2000-01-01 00:00:00');
+        INSERT INTO work_queue (payload, status, run_at, claimed_by, lease_expires_at, started_at)
+        VALUES ('expired', 'running', '2000-01-01 00:00:00', 'crashed', '2000-01-01 00:05:00', '2000-01-01 00:00:00');
+        """
+    )
+    conn.close()
+
+    store = WorkQueueStore(sqlite3.connect(db_path))
+
+    types = dict(row[1:3] for row in store.conn.execute("PRAGMA table_info(work_queue)"))
+    assert types["run_at"] == "INTEGER"
+    assert store.get_job(1)["run_at"] == 946684800
+    indexes = {row[1] for row in store.conn.execute("PRAGMA index_list(work_queue)")}
+    assert {"idx_wq_runnable_at", "idx_wq_running_lease"} <= indexes
+    assert store.requeue_expired_running().rows_affected == 1
+    assert store.claim_next("worker-1")["id"] == 1
+    assert store.enqueue("new") == 3
+
+
+@pytest.mark.parametrize(
+    "row_sql",
+    [
+        # A NOT NULL column fails the copy outright.
+        "VALUES ('bad', 'queued', 'not a time', NULL, NULL, 'not a time', 'not a time')",
+        # Nullable lease/start columns would silently become NULL and strand the running job.
+        "VALUES ('bad', 'running', '2024-01-01 00:00:00', 'not a time', '2024-01-01 00:00:00',"
+        " '2024-01-01 00:00:00', '2024-01-01 00:00:00')",
+        "VALUES ('bad', 'running', '2024-01-01 00:00:00', '2024-01-01 00:05:00', 'not a time',"
+        " '2024-01-01 00:00:00', '2024-01-01 00:00:00')",
+    ],
+)
+def test_unconvertible_text_timestamps_raise_a_clear_error(tmp_path, row_sql):
+    db_path = tmp_path / "bad-timestamps.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript(
+        f"""
+        CREATE TABLE work_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            payload TEXT,
+            status TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            run_at TEXT NOT NULL,
+            claimed_by TEXT,
+            lease_expires_at TEXT,
+            started_at TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        INSERT INTO work_queue (payload, status, run_at, lease_expires_at, started_at, created_at, updated_at)
+        {row_sql};
+        """
+    )
+    before = conn.execute("SELECT * FROM work_queue").fetchall()
+    conn.close()
+
+    with pytest.raises(RuntimeError, match=r"TEXT timestamp .*job ids \[1\]"):
+        WorkQueueStore(sqlite3.connect(db_path))
+
+    untouched = sqlite3.connect(db_path)
+    assert untouched.execute("SELECT * FROM work_queue").fetchall() == before
+    assert untouched.execute("SELECT type FROM pragma_table_info('work_queue') WHERE name = 'run_at'").fetchone() == (
+        "TEXT",
+    )
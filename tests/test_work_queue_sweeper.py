@@ -2,8 +2,10 @@ from __future__ import annotations
 
 import sqlite3
 
+import pytest
+
 from work_queue import WorkQueueStore
-from work_queue_sweeper import run_sweeper_loop, sweep_once
+from work_queue_sweeper import MIN_SLEEP_SECONDS, _close, main, next_sleep_seconds, run_sweeper_loop, sweep_once
 
 
 def test_sweep_once_requeues_expired_running_jobs(tmp_path):
@@ -19,7 +21,7 @@ def test_sweep_once_requeues_expired_running_jobs(tmp_path):
     store.conn.execute(
         """
         UPDATE work_queue
-        SET lease_expires_at = datetime(now(), '-20 seconds')
+        SET lease_expires_at = unixepoch() - 20
         WHERE id = ?
         """,
         (expired,),
@@ -27,7 +29,7 @@ def test_sweep_once_requeues_expired_running_jobs(tmp_path):
     store.conn.execute(
         """
         UPDATE work_queue
-        SET lease_expires_at = datetime(now(), '+20 seconds')
+        SET lease_expires_at = unixepoch() + 20
         WHERE id = ?
         """,
         (active,),
@@ -62,7 +64,7 @@ def test_run_sweeper_loop_emits_events_and_sleeps_between_iterations(tmp_path):
     store.conn.execute(
         """
         UPDATE work_queue
-        SET lease_expires_at = datetime(now(), '-20 seconds')
+        SET lease_expires_at = unixepoch() - 20
         WHERE id IN (?, ?)
         """,
         (first, second),
@@ -103,3 +105,117 @@ def test_run_sweeper_loop_validates_inputs(tmp_path):
         raise AssertionError("expected iterations validation")
     except ValueError as exc:
         assert "iterations" in str(exc)
+
+
+def test_run_sweeper_loop_opens_one_connection_for_all_iterations(tmp_path, monkeypatch):
+    opened: list[str] = []
+
+    def counting_connect(database: str, **kwargs: object) -> sqlite3.Connection:
+        opened.append(database)
+        return sqlite3.connect(database, **kwargs)
+
+    monkeypatch.setattr("work_queue_sweeper.connect", counting_connect)
+
+    report = run_sweeper_loop(str(tmp_path / "reuse.db"), interval_seconds=1.0, iterations=3, sleep_fn=lambda _: None)
+
+    assert report.iterations == 3
+    assert opened == [str(tmp_path / "reuse.db")]
+
+
+def test_run_sweeper_loop_wakes_at_next_lease_expiry(tmp_path):
+    db_path = tmp_path / "adaptive.db"
+    conn = sqlite3.connect(db_path)
+    store = WorkQueueStore(conn)
+
+    job_id = store.enqueue("soon", run_at="2000-01-01 00:00:00")
+    store.claim(job_id, "w1")
+    store.conn.execute("UPDATE work_queue SET lease_expires_at = unixepoch() + 2 WHERE id = ?", (job_id,))
+    store.conn.commit()
+    conn.close()
+
+    sleeps: list[float] = []
+    run_sweeper_loop(str(db_path), interval_seconds=30.0, iterations=2, sleep_fn=sleeps.append)
+
+    assert len(sleeps) == 1
+    assert 1.0 <= sleeps[0] <= 2.0
+
+
+def test_next_sleep_seconds_is_floored_and_capped():
+    store = WorkQueueStore(sqlite3.connect(":memory:"))
+    assert next_sleep_seconds(store, 5.0) == 5.0
+
+    job_id = store.enqueue("due")
+    store.claim(job_id, "w1")
+    store.conn.execute("UPDATE work_queue SET lease_expires_at = unixepoch() - 10 WHERE id = ?", (job_id,))
+    store.conn.commit()
+    assert next_sleep_seconds(store, 5.0) == MIN_SLEEP_SECONDS
+
+    store.conn.execute("UPDATE work_queue SET lease_expires_at = unixepoch() + 600 WHERE id = ?", (job_id,))
+    store.conn.commit()
+    assert next_sleep_seconds(store, 5.0) == 5.0
+
+
+def test_run_sweeper_loop_exclusive_holds_lock_until_exit(tmp_path):
+    db_path = tmp_path / "exclusive.db"
+    sqlite3.connect(db_path).close()
+    blocked: list[bool] = []
+
+    def probe(_: dict[str, object]) -> None:
+        other = sqlite3.connect(db_path, timeout=0)
+        try:
+            other.execute("SELECT COUNT(*) FROM work_queue").fetchone()
+            blocked.append(False)
+        except sqlite3.OperationalError:
+            blocked.append(True)
+        finally:
+            other.close()
+
+    run_sweeper_loop(str(db_path), interval_seconds=1.0, iterations=1, emit_fn=probe, exclusive=True)
+
+    assert blocked == [True]
+    reopened = sqlite3.connect(db_path, timeout=0)
+    assert reopened.execute("SELECT COUNT(*) FROM work_queue").fetchone() == (0,)
+    reopened.close()
+
+
+def test_main_prints_one_sorted_json_line_per_event(tmp_path, capsys):
+    db_path = tmp_path / "cli.db"
+    sqlite3.connect(db_path).close()
+
+    assert main(["--db-path", str(db_path), "--interval-seconds", "0.1", "--iterations", "1"]) == 0
+
+    assert capsys.readouterr().out.splitlines() == [
+        '{"code": "work_queue_sweep", "iteration": 1, "ok": true, "rows_requeued": 0}',
+        '{"code": "work_queue_sweeper_complete", "iterations": 1, "total_requeued": 0}',
+    ]
+
+
+class _LockedOnOptimize:
+    def __init__(self) -> None:
+        self.closed = False
+
+    def execute(self, sql: str) -> None:
+        assert sql == "PRAGMA optimize"
+        raise sqlite3.OperationalError("database is locked")
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_close_failure_never_leaks_the_connection_or_masks_a_failed_sweep(monkeypatch):
+    clean = _LockedOnOptimize()
+    with pytest.raises(sqlite3.OperationalError, match="locked"):
+        _close(clean)
+    assert clean.closed is True
+
+    failing = _LockedOnOptimize()
+    monkeypatch.setattr("work_queue_sweeper.connect", lambda database, **kwargs: failing)
+    monkeypatch.setattr("work_queue_sweeper.WorkQueueStore", lambda conn: None)
+
+    def broken_sweep(store: object) -> None:
+        raise RuntimeError("sweep failed")
+
+    monkeypatch.setattr("work_queue_sweeper.sweep_once_with_store", broken_sweep)
+    with pytest.raises(RuntimeError, match="sweep failed"):
+        sweep_once("unused.db")
+    assert failing.closed is True
@@ -1,23 +1,52 @@
 from __future__ import annotations
 
+import os
 import sqlite3
+import threading
 import time
+import weakref
+from contextlib import contextmanager
 from random import random
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Any, Callable
+from typing import Any, Callable, Iterator, Sequence
+
+from db_connection import ThreadLocalConnections, configure_connection
 
 VALID_STATUSES = ("queued", "running", "completed", "failed")
 
+# Writer locks per database file, so writers in this process wait on a Python lock instead of in
+# SQLite's busy handler without a batch on one database stalling writers to another. Entries go
+# away once no store holds the lock.
+_WRITE_LOCKS: weakref.WeakValueDictionary[str, Any] = weakref.WeakValueDictionary()
+_WRITE_LOCKS_GUARD = threading.Lock()
 
-@dataclass(frozen=True)
+
+def _write_lock_for(conn: sqlite3.Connection) -> Any:
+    """Returns the reentrant writer lock shared by every store on conn's main database file.
+
+    Reentrant so batch() can hold it across the mutations it wraps. In-memory and temporary
+    databases have no file and are only reachable through their connection, so they are keyed
+    on it instead.
+    """
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    key = f"file:{os.path.realpath(path)}" if path else f"conn:{id(conn)}"
+    with _WRITE_LOCKS_GUARD:
+        lock = _WRITE_LOCKS.get(key)
+        if lock is None:
+            lock = threading.RLock()
+            _WRITE_LOCKS[key] = lock
+        return lock
+
+
+@dataclass(frozen=True, slots=True)
 class MutationResult:
     ok: bool
     rows_affected: int
     diagnostics: dict[str, Any]
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class WorkerEvent:
     type: str
     job_id: int
@@ -25,7 +54,7 @@ class WorkerEvent:
     payload: dict[str, Any]
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class WorkerRunResult:
     status: str
     lease_lost: bool
@@ -72,47 +101,235 @@ def compute_idle_backoff_delay_seconds(
     return min(effective_delay, policy.operational_ceiling_seconds)
 
 
+def _to_epoch_seconds(value: str | int) -> int:
+    """Accepts unix seconds or an ISO-8601 timestamp; naive timestamps are read as UTC."""
+    if isinstance(value, int):
+        return value
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
 class WorkQueueStore:
     """Persistence helpers for work_queue state transitions."""
 
-    def __init__(self, conn: sqlite3.Connection):
-        self.conn = conn
-        self.conn.row_factory = sqlite3.Row
-        # Define now() once so every mutation can use DB-side now() in SQL.
-        self.conn.create_function("now", 0, lambda: datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"))
+    def __init__(self, conn: sqlite3.Connection | ThreadLocalConnections):
+        """Binds the store to one connection, or to a per-thread connection from ``conn.get()``.
+
+        With ThreadLocalConnections one store can be shared by worker threads; each thread
+        issues its statements on its own connection.
+        """
+        if isinstance(conn, ThreadLocalConnections):
+            self._connections: ThreadLocalConnections | None = conn
+            self._conn: sqlite3.Connection | None = None
+        else:
+            self._connections = None
+            self._conn = configure_connection(conn)
+            self._conn.row_factory = sqlite3.Row
+        # batch() state is per thread: a batch on one thread must not defer another thread's commits.
+        self._batch_state = threading.local()
+        self._write_lock = _write_lock_for(self.conn)
         self._ensure_schema()
 
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._connections is None:
+            return self._conn
+        return self._connections.get()
+
+    @property
+    def _in_batch(self) -> bool:
+        return getattr(self._batch_state, "active", False)
+
+    @_in_batch.setter
+    def _in_batch(self, active: bool) -> None:
+        self._batch_state.active = active
+
     def _ensure_schema(self) -> None:
-        self.conn.execute(
-            """
+        table_sql = """
             CREATE TABLE IF NOT EXISTS work_queue (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 payload TEXT,
                 status TEXT NOT NULL CHECK (status IN ('queued', 'running', 'completed', 'failed')),
                 priority INTEGER NOT NULL DEFAULT 0,
-                run_at TEXT NOT NULL DEFAULT (now()),
+                run_at INTEGER NOT NULL DEFAULT (unixepoch()),
                 claimed_by TEXT,
-                lease_expires_at TEXT,
-                started_at TEXT,
-                created_at TEXT NOT NULL DEFAULT (now()),
-                updated_at TEXT NOT NULL DEFAULT (now())
+                lease_expires_at INTEGER,
+                started_at INTEGER,
+                created_at INTEGER NOT NULL DEFAULT (unixepoch()),
+                updated_at INTEGER NOT NULL DEFAULT (unixepoch())
+            );
+        """
+        index_sql = """
+            -- claim_next walks queued rows already in claim order and stops at the first runnable one;
+            -- run_at is filtered from the index entry, so the table row is only read once a runnable row is found.
+            DROP INDEX IF EXISTS idx_wq_runnable;
+            CREATE INDEX IF NOT EXISTS idx_wq_runnable_at
+            ON work_queue(priority DESC, created_at ASC, id ASC, run_at)
+            WHERE status = 'queued';
+
+            -- Expired-lease requeues and the active-capacity count only touch running rows.
+            CREATE INDEX IF NOT EXISTS idx_wq_running_lease
+            ON work_queue(lease_expires_at)
+            WHERE status = 'running';
+        """
+        if not self._has_text_timestamps():
+            # One executescript call for all DDL; like the commit() it replaces, it first commits
+            # any pending transaction on the connection.
+            self.conn.executescript(table_sql + index_sql)
+            return
+
+        # TEXT timestamps never compare as due against unixepoch() (INTEGER sorts before TEXT),
+        # so the table is rebuilt with converted values. The old table is dropped before the
+        # indexes are created, since it may already own indexes with the same names.
+        try:
+            self.conn.executescript(
+                "BEGIN IMMEDIATE;"
+                " ALTER TABLE work_queue RENAME TO work_queue_text_timestamps;"
+                + table_sql
+                + """
+                INSERT INTO work_queue (
+                    id, payload, status, priority, run_at, claimed_by,
+                    lease_expires_at, started_at, created_at, updated_at
+                )
+                SELECT id, payload, status, priority, unixepoch(run_at), claimed_by,
+                       unixepoch(lease_expires_at), unixepoch(started_at),
+                       unixepoch(created_at), unixepoch(updated_at)
+                FROM work_queue_text_timestamps;
+
+                -- unixepoch() yields NULL for text it cannot parse. NOT NULL columns already fail
+                -- the INSERT; for the nullable lease/start columns a NULL would strand the job
+                -- (a running row without a lease is never requeued or reclaimed), so any such row
+                -- aborts the migration through this CHECK.
+                CREATE TEMP TABLE work_queue_unconvertible (
+                    id INTEGER CONSTRAINT unconvertible_timestamp CHECK (id IS NULL)
+                );
+                INSERT INTO work_queue_unconvertible (id)
+                SELECT id FROM work_queue_text_timestamps
+                WHERE (lease_expires_at IS NOT NULL AND unixepoch(lease_expires_at) IS NULL)
+                   OR (started_at IS NOT NULL AND unixepoch(started_at) IS NULL);
+                DROP TABLE temp.work_queue_unconvertible;
+
+                DROP TABLE work_queue_text_timestamps;
+                """
+                + index_sql
+                + "COMMIT;"
             )
-            """
-        )
-        self.conn.commit()
+        except sqlite3.Error as exc:
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            self.conn.execute("DROP TABLE IF EXISTS temp.work_queue_unconvertible")
+            raise RuntimeError(
+                "work_queue has TEXT timestamp values that could not be converted to unix seconds"
+                f" (job ids {self._unconvertible_timestamp_ids()}); fix them or recreate the database"
+            ) from exc
+
+    def _unconvertible_timestamp_ids(self) -> list[int]:
+        """Ids of TEXT-era rows holding a timestamp unixepoch() cannot parse, for the migration error."""
+        return [
+            row[0]
+            for row in self._tuple_cursor().execute(
+                """
+                SELECT id FROM work_queue
+                WHERE unixepoch(run_at) IS NULL
+                   OR unixepoch(created_at) IS NULL
+                   OR unixepoch(updated_at) IS NULL
+                   OR (lease_expires_at IS NOT NULL AND unixepoch(lease_expires_at) IS NULL)
+                   OR (started_at IS NOT NULL AND unixepoch(started_at) IS NULL)
+                ORDER BY id
+                LIMIT 10
+                """
+            )
+        ]
+
+    def _has_text_timestamps(self) -> bool:
+        """True for a work_queue table created before timestamps became INTEGER unix seconds."""
+        columns = dict(row[1:3] for row in self._tuple_cursor().execute("PRAGMA table_info(work_queue)"))
+        return columns.get("run_at", "").upper() == "TEXT"
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """Defers mutation commits so several calls share one transaction, committed on exit.
+
+        All or nothing: if the block raises, every mutation made in it is rolled back.
+        Only for bursts issued by one caller: a deferred heartbeat is invisible to other
+        connections until exit, so lease renewals must not be held in a batch.
+        """
+        if self._in_batch:
+            yield
+            return
+        # The writer lock spans the batch: its transaction holds SQLite's write lock until exit.
+        with self._write_lock:
+            self._in_batch = True
+            try:
+                yield
+            except BaseException:
+                self._in_batch = False
+                self.conn.rollback()
+                raise
+            else:
+                self._in_batch = False
+                self.conn.commit()
+
+    def _commit(self) -> None:
+        if not self._in_batch:
+            self.conn.commit()
 
-    def enqueue(self, payload: str, *, priority: int = 0, run_at: str | None = None) -> int:
-        scheduled_run_at = run_at or self.conn.execute("SELECT now()").fetchone()[0]
-        cur = self.conn.execute(
+    @contextmanager
+    def _write_transaction(self) -> Iterator[None]:
+        """Holds this database's writer lock around one write transaction and its commit.
+
+        The transaction is opened with BEGIN IMMEDIATE rather than sqlite3's implicit deferred
+        BEGIN, so the write lock is taken up front; a deferred transaction that read first can
+        fail its upgrade with SQLITE_BUSY, which the busy timeout does not retry in WAL mode.
+        """
+        with self._write_lock:
+            began = not self.conn.in_transaction
+            if began:
+                self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except Exception:
+                if began:
+                    self.conn.rollback()
+                raise
+            self._commit()
+
+    def _execute_write(self, sql: str, params: tuple[Any, ...] = ()) -> sqlite3.Cursor:
+        with self._write_transaction():
+            return self.conn.execute(sql, params)
+
+    def enqueue(self, payload: str, *, priority: int = 0, run_at: str | int | None = None) -> int:
+        cur = self._execute_write(
             """
-            INSERT INTO work_queue (payload, status, priority, run_at)
-            VALUES (?, 'queued', ?, ?)
+            INSERT INTO work_queue (payload, status, priority, run_at, created_at, updated_at)
+            VALUES (?, 'queued', ?, COALESCE(?, unixepoch()), unixepoch(), unixepoch())
             """,
-            (payload, priority, scheduled_run_at),
+            (payload, priority, None if run_at in (None, "") else _to_epoch_seconds(run_at)),
         )
-        self.conn.commit()
         return int(cur.lastrowid)
 
+    def enqueue_many(self, jobs: Sequence[tuple[str, int, str | int | None]]) -> list[int]:
+        """Enqueues (payload, priority, run_at) jobs in one transaction and returns their ids in order."""
+        rows = [
+            (payload, priority, None if run_at in (None, "") else _to_epoch_seconds(run_at))
+            for payload, priority, run_at in jobs
+        ]
+        if not rows:
+            return []
+        with self._write_transaction():
+            self.conn.executemany(
+                """
+                INSERT INTO work_queue (payload, status, priority, run_at, created_at, updated_at)
+                VALUES (?, 'queued', ?, COALESCE(?, unixepoch()), unixepoch(), unixepoch())
+                """,
+                rows,
+            )
+            # AUTOINCREMENT ids are contiguous here: the write lock is held for the whole insert.
+            last_id = self._tuple_cursor().execute("SELECT last_insert_rowid()").fetchone()[0]
+        return list(range(last_id - len(rows) + 1, last_id + 1))
+
     def claim_next(
         self,
         worker_id: str,
@@ -123,83 +340,190 @@ class WorkQueueStore:
         if max_active_running is not None and max_active_running < 0:
             raise ValueError("max_active_running must be >= 0")
 
-        self.conn.execute("BEGIN IMMEDIATE")
-        try:
-            self.conn.execute(
-                """
-                UPDATE work_queue
-                SET status = 'queued',
-                    claimed_by = NULL,
-                    lease_expires_at = NULL,
-                    updated_at = now()
-                WHERE status = 'running'
-                  AND lease_expires_at IS NOT NULL
-                  AND lease_expires_at <= now()
-                """
-            )
-            row = self.conn.execute(
+        # Expired leases are claimed in place rather than requeued first, so a claim writes only the
+        # row it takes; the sweeper still requeues leases nobody reclaims.
+        with self._write_transaction():
+            return self.conn.execute(
                 """
-                WITH active_capacity AS (
-                    SELECT COUNT(*) AS active_running
-                    FROM work_queue
-                    WHERE status = 'running'
-                      AND lease_expires_at IS NOT NULL
-                      AND lease_expires_at > now()
+                WITH runnable AS (
+                    SELECT * FROM (
+                        SELECT id, priority, created_at
+                        FROM work_queue
+                        WHERE status = 'queued'
+                          AND run_at <= unixepoch()
+                        ORDER BY priority DESC, created_at ASC, id ASC
+                        LIMIT 1
+                    )
+                    UNION ALL
+                    SELECT * FROM (
+                        SELECT id, priority, created_at
+                        FROM work_queue
+                        WHERE status = 'running'
+                          AND lease_expires_at IS NOT NULL
+                          AND lease_expires_at <= unixepoch()
+                        ORDER BY priority DESC, created_at ASC, id ASC
+                        LIMIT 1
+                    )
                 ),
                 candidate AS (
                     SELECT id
-                    FROM work_queue
-                    WHERE status = 'queued'
-                      AND run_at <= now()
-                      AND (? IS NULL OR (SELECT active_running FROM active_capacity) < ?)
-                    ORDER BY priority DESC, created_at ASC
+                    FROM runnable
+                    -- Under capacity means there is no live lease at offset cap - 1, so the probe
+                    -- reads at most cap index entries instead of counting every running row.
+                    WHERE (
+                        ? IS NULL
+                        OR (
+                            ? > 0
+                            AND NOT EXISTS (
+                                SELECT 1
+                                FROM work_queue
+                                WHERE status = 'running'
+                                  AND lease_expires_at IS NOT NULL
+                                  AND lease_expires_at > unixepoch()
+                                LIMIT 1 OFFSET ? - 1
+                            )
+                        )
+                    )
+                    ORDER BY priority DESC, created_at ASC, id ASC
                     LIMIT 1
                 )
                 UPDATE work_queue
                 SET status = 'running',
                     claimed_by = ?,
-                    lease_expires_at = datetime(now(), '+' || ? || ' seconds'),
-                    started_at = now(),
-                    updated_at = now()
+                    lease_expires_at = unixepoch() + ?,
+                    started_at = unixepoch(),
+                    updated_at = unixepoch()
                 WHERE id = (SELECT id FROM candidate)
                 RETURNING *
                 """,
-                (max_active_running, max_active_running, worker_id, lease_duration_seconds),
+                (max_active_running, max_active_running, max_active_running, worker_id, lease_duration_seconds),
             ).fetchone()
-            self.conn.commit()
-            return row
-        except Exception:
-            self.conn.rollback()
-            raise
+
+    def claim_next_batch(
+        self,
+        worker_id: str,
+        n: int,
+        lease_duration_seconds: int = 30,
+        *,
+        max_active_running: int | None = None,
+    ) -> list[sqlite3.Row]:
+        """Claims up to ``n`` runnable jobs for ``worker_id`` with one UPDATE, in claim_next order.
+
+        Candidates are the same as claim_next's: queued runnable rows and expired leases, which
+        are reclaimed in place. Under ``max_active_running`` the batch is trimmed so live leases
+        never exceed the cap. The caller hands the claimed jobs out to its own workers.
+        """
+        if n <= 0:
+            raise ValueError("n must be > 0")
+        if max_active_running is not None and max_active_running < 0:
+            raise ValueError("max_active_running must be >= 0")
+
+        with self._write_transaction():
+            rows = self.conn.execute(
+                """
+                WITH runnable AS (
+                    SELECT * FROM (
+                        SELECT id, priority, created_at
+                        FROM work_queue
+                        WHERE status = 'queued'
+                          AND run_at <= unixepoch()
+                        ORDER BY priority DESC, created_at ASC, id ASC
+                        LIMIT ?
+                    )
+                    UNION ALL
+                    SELECT * FROM (
+                        SELECT id, priority, created_at
+                        FROM work_queue
+                        WHERE status = 'running'
+                          AND lease_expires_at IS NOT NULL
+                          AND lease_expires_at <= unixepoch()
+                        ORDER BY priority DESC, created_at ASC, id ASC
+                        LIMIT ?
+                    )
+                ),
+                candidates AS (
+                    SELECT id
+                    FROM runnable
+                    ORDER BY priority DESC, created_at ASC, id ASC
+                    -- Remaining capacity counts at most cap live leases, like claim_next's probe.
+                    LIMIT (
+                        CASE WHEN ? IS NULL THEN ?
+                        ELSE MAX(0, MIN(?, ? - (
+                            SELECT COUNT(*) FROM (
+                                SELECT 1
+                                FROM work_queue
+                                WHERE status = 'running'
+                                  AND lease_expires_at IS NOT NULL
+                                  AND lease_expires_at > unixepoch()
+                                LIMIT ?
+                            )
+                        )))
+                        END
+                    )
+                )
+                UPDATE work_queue
+                SET status = 'running',
+                    claimed_by = ?,
+                    lease_expires_at = unixepoch() + ?,
+                    started_at = unixepoch(),
+                    updated_at = unixepoch()
+                WHERE id IN (SELECT id FROM candidates)
+                RETURNING *
+                """,
+                (
+                    n,
+                    n,
+                    max_active_running,
+                    n,
+                    n,
+                    max_active_running,
+                    max_active_running,
+                    worker_id,
+                    lease_duration_seconds,
+                ),
+            ).fetchall()
+        # RETURNING order is unspecified; hand jobs out in claim order.
+        return sorted(rows, key=lambda row: (-row["priority"], row["created_at"], row["id"]))
 
     def requeue_expired_running(self) -> MutationResult:
-        rows = self.conn.execute(
+        rows = self._execute_write(
             """
             UPDATE work_queue
             SET status = 'queued',
                 claimed_by = NULL,
                 lease_expires_at = NULL,
-                updated_at = now()
+                updated_at = unixepoch()
             WHERE status = 'running'
               AND lease_expires_at IS NOT NULL
-              AND lease_expires_at <= now()
+              AND lease_expires_at <= unixepoch()
             """
         ).rowcount
-        self.conn.commit()
         return MutationResult(ok=True, rows_affected=rows, diagnostics={"code": "ok"})
 
+    def seconds_until_next_lease_expiry(self) -> int | None:
+        """Seconds by the DB clock until the earliest running lease expires (<= 0 if already due).
+
+        Returns None when no running job holds a lease.
+        """
+        return self._tuple_cursor().execute(
+            """
+            SELECT MIN(lease_expires_at) - unixepoch()
+            FROM work_queue
+            WHERE status = 'running'
+            """
+        ).fetchone()[0]
+
     def claim(self, job_id: int, worker_id: str) -> MutationResult:
-        rows = self.conn.execute(
+        rows = self._execute_write(
             """
             UPDATE work_queue
-            SET status = 'running', claimed_by = ?, updated_at = now()
+            SET status = 'running', claimed_by = ?, updated_at = unixepoch()
             WHERE id = ? AND status = 'queued'
             """,
             (worker_id, job_id),
         ).rowcount
-        self.conn.commit()
         if rows == 0:
-            current = self._get_status(job_id)
+            current, _ = self._get_state(job_id)
             return MutationResult(
                 ok=False,
                 rows_affected=0,
@@ -213,16 +537,15 @@ class WorkQueueStore:
         return MutationResult(ok=True, rows_affected=rows, diagnostics={"code": "ok"})
 
     def heartbeat(self, job_id: int, worker_id: str, lease_duration_seconds: int = 30) -> MutationResult:
-        rows = self.conn.execute(
+        rows = self._execute_write(
             """
             UPDATE work_queue
-            SET lease_expires_at = datetime(now(), '+' || ? || ' seconds'),
-                updated_at = now()
+            SET lease_expires_at = unixepoch() + ?,
+                updated_at = unixepoch()
             WHERE id = ? AND claimed_by = ? AND status = 'running'
             """,
             (lease_duration_seconds, job_id, worker_id),
         ).rowcount
-        self.conn.commit()
         return self._owner_guard_result(rows, job_id, worker_id, action="heartbeat")
 
     def complete(self, job_id: int, worker_id: str) -> MutationResult:
@@ -243,22 +566,20 @@ class WorkQueueStore:
                 },
             )
 
-        rows = self.conn.execute(
+        rows = self._execute_write(
             """
             UPDATE work_queue
             SET status = ?,
                 claimed_by = NULL,
                 lease_expires_at = NULL,
-                updated_at = now()
+                updated_at = unixepoch()
             WHERE id = ? AND claimed_by = ? AND status = 'running'
             """,
             (target_status, job_id, worker_id),
         ).rowcount
-        self.conn.commit()
 
         if rows == 0:
-            current = self._get_status(job_id)
-            owner = self._get_owner(job_id)
+            current, owner = self._get_state(job_id)
             reason = "not_owner" if owner is not None and owner != worker_id else "invalid_transition"
             return MutationResult(
                 ok=False,
@@ -280,8 +601,7 @@ class WorkQueueStore:
     def _owner_guard_result(self, rows: int, job_id: int, worker_id: str, action: str) -> MutationResult:
         if rows:
             return MutationResult(ok=True, rows_affected=rows, diagnostics={"code": "ok"})
-        owner = self._get_owner(job_id)
-        status = self._get_status(job_id)
+        status, owner = self._get_state(job_id)
         reason = "not_owner" if owner is not None and owner != worker_id else "invalid_transition"
         return MutationResult(
             ok=False,
@@ -297,13 +617,16 @@ class WorkQueueStore:
             },
         )
 
-    def _get_status(self, job_id: int) -> str | None:
-        row = self.conn.execute("SELECT status FROM work_queue WHERE id = ?", (job_id,)).fetchone()
-        return row[0] if row else None
+    def _get_state(self, job_id: int) -> tuple[str | None, str | None]:
+        """Returns (status, claimed_by) for failure diagnostics in one lookup; (None, None) if missing."""
+        row = self._tuple_cursor().execute("SELECT status, claimed_by FROM work_queue WHERE id = ?", (job_id,)).fetchone()
+        return row if row else (None, None)
 
-    def _get_owner(self, job_id: int) -> str | None:
-        row = self.conn.execute("SELECT claimed_by FROM work_queue WHERE id = ?", (job_id,)).fetchone()
-        return row[0] if row else None
+    def _tuple_cursor(self) -> sqlite3.Cursor:
+        """Cursor yielding plain tuples, for internal reads that never hand rows to callers."""
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        return cursor
 
     def get_job(self, job_id: int) -> sqlite3.Row:
         row = self.conn.execute("SELECT * FROM work_queue WHERE id = ?", (job_id,)).fetchone()
@@ -334,19 +657,25 @@ class WorkerRuntime:
         lease_duration_seconds: int = 30,
     ) -> WorkerRunResult:
         heartbeat_every = max(1, lease_duration_seconds // 3)
-        next_heartbeat_at = self.now_fn() + heartbeat_every
+        now_fn = self.now_fn
+        next_heartbeat_at = now_fn() + heartbeat_every
         events: list[WorkerEvent] = []
+        worker_id = self.worker_id
 
+        # One clock read per step. Steps have no bounded duration, so skipping reads across
+        # several steps could let the lease lapse; the next deadline reuses the read that
+        # triggered the heartbeat, which can only schedule it earlier.
         while True:
-            if self.now_fn() >= next_heartbeat_at:
-                renewal = self.store.heartbeat(job_id, self.worker_id, lease_duration_seconds=lease_duration_seconds)
+            now = now_fn()
+            if now >= next_heartbeat_at:
+                renewal = self.store.heartbeat(job_id, worker_id, lease_duration_seconds=lease_duration_seconds)
                 if not renewal.ok:
                     self.lease_lost = True
                     events.append(
                         WorkerEvent(
                             type="lease_lost",
                             job_id=job_id,
-                            worker_id=self.worker_id,
+                            worker_id=worker_id,
                             payload={"status": "lease_lost", "diagnostics": renewal.diagnostics},
                         )
                     )
@@ -356,11 +685,11 @@ class WorkerRuntime:
                     WorkerEvent(
                         type="heartbeat_renewed",
                         job_id=job_id,
-                        worker_id=self.worker_id,
+                        worker_id=worker_id,
                         payload={"status": "running", "lease_duration_seconds": lease_duration_seconds},
                     )
                 )
-                next_heartbeat_at = self.now_fn() + heartbeat_every
+                next_heartbeat_at = now + heartbeat_every
 
             if not process_step():
                 return WorkerRunResult(status="processing_complete", lease_lost=False, events=events)
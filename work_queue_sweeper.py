@@ -3,12 +3,19 @@ from __future__ import annotations
 import argparse
 import json
 import sqlite3
+import sys
 import time
 from dataclasses import dataclass
 from typing import Callable
 
+from db_connection import connect
 from work_queue import MutationResult, WorkQueueStore
 
+# json.dumps(..., sort_keys=True) builds a new encoder per call; the CLI emits one line per sweep.
+_EVENT_ENCODER = json.JSONEncoder(sort_keys=True)
+# Floor on the adaptive sleep so an already-due lease cannot turn the loop into a spin.
+MIN_SLEEP_SECONDS = 0.1
+
 
 @dataclass(frozen=True)
 class SweeperReport:
@@ -16,11 +23,39 @@ class SweeperReport:
     total_requeued: int
 
 
+def sweep_once_with_store(store: WorkQueueStore) -> MutationResult:
+    return store.requeue_expired_running()
+
+
 def sweep_once(db_path: str) -> MutationResult:
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
     try:
-        store = WorkQueueStore(conn)
-        return store.requeue_expired_running()
+        return sweep_once_with_store(WorkQueueStore(conn))
+    finally:
+        _close(conn)
+
+
+def next_sleep_seconds(store: WorkQueueStore, interval_seconds: float) -> float:
+    """Sleeps until the earliest running lease expires, capped at interval_seconds."""
+    until_expiry = store.seconds_until_next_lease_expiry()
+    if until_expiry is None:
+        return interval_seconds
+    return max(MIN_SLEEP_SECONDS, min(interval_seconds, float(until_expiry)))
+
+
+def _close(conn: sqlite3.Connection) -> None:
+    """Refreshes planner statistics, then always closes the connection.
+
+    Callers run this from ``finally``; when a sweep is already failing, an optimize error
+    (e.g. "database is locked") is dropped so the original exception propagates.
+    """
+    unwinding = sys.exc_info()[1] is not None
+    try:
+        # Refresh planner statistics for the partial queue indexes as the table grows and drains.
+        conn.execute("PRAGMA optimize")
+    except sqlite3.Error:
+        if not unwinding:
+            raise
     finally:
         conn.close()
 
@@ -32,7 +67,14 @@ def run_sweeper_loop(
     iterations: int | None = None,
     sleep_fn: Callable[[float], None] = time.sleep,
     emit_fn: Callable[[dict[str, object]], None] | None = None,
+    exclusive: bool = False,
 ) -> SweeperReport:
+    """Sweeps expired leases until ``iterations`` is reached (forever when None).
+
+    ``exclusive`` puts the loop's connection in ``locking_mode=EXCLUSIVE`` so commits skip
+    file-lock acquire/release. The lock is then held until the loop exits and blocks every
+    other connection, readers included, so it is only safe when nothing else opens the database.
+    """
     if interval_seconds <= 0:
         raise ValueError("interval_seconds must be > 0")
     if iterations is not None and iterations <= 0:
@@ -41,23 +83,31 @@ def run_sweeper_loop(
     completed_iterations = 0
     total_requeued = 0
 
-    while iterations is None or completed_iterations < iterations:
-        result = sweep_once(db_path)
-        completed_iterations += 1
-        total_requeued += result.rows_affected
-
-        if emit_fn is not None:
-            emit_fn(
-                {
-                    "code": "work_queue_sweep",
-                    "ok": result.ok,
-                    "rows_requeued": result.rows_affected,
-                    "iteration": completed_iterations,
-                }
-            )
-
-        if iterations is None or completed_iterations < iterations:
-            sleep_fn(interval_seconds)
+    # One connection and store for the whole loop, so cached statements survive across iterations.
+    conn = connect(db_path)
+    try:
+        if exclusive:
+            conn.execute("PRAGMA locking_mode=EXCLUSIVE")
+        store = WorkQueueStore(conn)
+        while iterations is None or completed_iterations < iterations:
+            result = sweep_once_with_store(store)
+            completed_iterations += 1
+            total_requeued += result.rows_affected
+
+            if emit_fn is not None:
+                emit_fn(
+                    {
+                        "code": "work_queue_sweep",
+                        "ok": result.ok,
+                        "rows_requeued": result.rows_affected,
+                        "iteration": completed_iterations,
+                    }
+                )
+
+            if iterations is None or completed_iterations < iterations:
+                sleep_fn(next_sleep_seconds(store, interval_seconds))
+    finally:
+        _close(conn)
 
     return SweeperReport(iterations=completed_iterations, total_requeued=total_requeued)
 
@@ -69,7 +119,7 @@ def _build_parser() -> argparse.ArgumentParser:
         "--interval-seconds",
         type=float,
         default=5.0,
-        help="Seconds to sleep between sweeps (default: 5.0)",
+        help="Maximum seconds to sleep between sweeps; wakes earlier for the next lease expiry (default: 5.0)",
     )
     parser.add_argument(
         "--iterations",
@@ -77,6 +127,11 @@ def _build_parser() -> argparse.ArgumentParser:
         default=None,
         help="Run a fixed number of iterations (default: run forever)",
     )
+    parser.add_argument(
+        "--exclusive",
+        action="store_true",
+        help="Hold an exclusive database lock for the whole run; only safe when no other process opens the database",
+    )
     return parser
 
 
@@ -84,22 +139,22 @@ def main(argv: list[str] | None = None) -> int:
     args = _build_parser().parse_args(argv)
 
     def emit(event: dict[str, object]) -> None:
-        print(json.dumps(event, sort_keys=True))
+        print(_EVENT_ENCODER.encode(event))
 
     report = run_sweeper_loop(
         args.db_path,
         interval_seconds=args.interval_seconds,
         iterations=args.iterations,
         emit_fn=emit,
+        exclusive=args.exclusive,
     )
     print(
-        json.dumps(
+        _EVENT_ENCODER.encode(
             {
                 "code": "work_queue_sweeper_complete",
                 "iterations": report.iterations,
                 "total_requeued": report.total_requeued,
-            },
-            sort_keys=True,
+            }
         )
     )
     return 0